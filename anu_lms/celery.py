@@ -15,9 +15,49 @@ app.autodiscover_tasks()
 
 # Celery Beat Schedule Configuration
 app.conf.beat_schedule = {
+    'send-overdue-reminders': {
+        'task': 'portal.tasks.send_overdue_reminders',
+        # Executes every day at 9:00 AM
+        'schedule': crontab(hour=9, minute=0),
+    },
     'send-daily-overdue-reminders': {
         'task': 'portal.tasks.send_due_reminders',
         # Executes every day at 8:00 AM
         'schedule': crontab(hour=8, minute=0),
     },
+    'rebuild-book-similarity': {
+        'task': 'portal.tasks.rebuild_book_similarity',
+        # Executes every night at 2:30 AM
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'precompute-recommendations': {
+        'task': 'portal.tasks.precompute_all_recommendations',
+        # Executes every night at 3:00 AM, after the similarity rebuild
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'reconcile-book-popularity': {
+        'task': 'portal.tasks.reconcile_book_popularity',
+        # Executes every night at 2:00 AM
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'rollup-circulation-stats': {
+        'task': 'portal.tasks.rollup_circulation_stats',
+        # Executes every night at 0:15 AM, once yesterday's loans can be counted as overdue
+        'schedule': crontab(hour=0, minute=15),
+    },
+    'publish-new-overdues': {
+        'task': 'portal.tasks.publish_new_overdues',
+        # Executes every day at 0:05 AM, once yesterday's due loans are overdue
+        'schedule': crontab(hour=0, minute=5),
+    },
+    'expire-reservation-holds': {
+        'task': 'portal.tasks.expire_reservation_holds',
+        # Executes every 15 minutes, so a lapsed hold passes to the next reader promptly
+        'schedule': crontab(minute='*/15'),
+    },
+    'dispatch-notifications': {
+        'task': 'portal.tasks.dispatch_notifications',
+        # Executes every 5 seconds; requests only write the outbox, this delivers it
+        'schedule': 5.0,
+    },
 }
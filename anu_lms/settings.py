@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -138,15 +140,24 @@ TEMPLATES = [
 WSGI_APPLICATION = "anu_lms.wsgi.application"
 ASGI_APPLICATION = "anu_lms.asgi.application"
 
-# Channel Layers
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [os.environ.get('REDIS_URL', 'redis://localhost:6379/0')],
+# Channel Layers: Redis is shared by the ASGI servers and the Celery workers that push to them.
+# CHANNEL_LAYER_BACKEND=memory swaps in the per-process in-memory layer for single-process
+# development and `manage.py benchmark_notifications`; it cannot reach other processes.
+if os.environ.get('CHANNEL_LAYER_BACKEND') == 'memory':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [os.environ.get('REDIS_URL', 'redis://localhost:6379/0')],
+            },
+        },
+    }
 
 
 # Database
@@ -160,6 +171,10 @@ DATABASES = {
     }
 }
 
+if "sqlite3" in str(DATABASES["default"].get("ENGINE", "")):
+    # A file-backed test database, so threaded tests (ConcurrentCirculationTest) race real connections
+    DATABASES['default']['TEST'] = {'NAME': Path(tempfile.gettempdir()) / 'anu_lms_test.sqlite3'}
+
 if "postgresql" in str(DATABASES["default"].get("ENGINE", "")):
     DATABASES['default'].update({
         "USER": os.environ.get('DB_USER', ''),
@@ -168,14 +183,6 @@ if "postgresql" in str(DATABASES["default"].get("ENGINE", "")):
         "PORT": os.environ.get('DB_PORT', '5432'),
     })
 
-# Caching Strategy (Redis)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
-    }
-}
-
 # Default primary key type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -221,12 +228,44 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
 
-# Caching
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Caching Strategy: Redis is shared by every worker and survives restarts;
+# without REDIS_URL fall back to a per-process LocMemCache for local development.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Recommendations
+RECOMMENDATION_SNAPSHOT_SIZE = 20  # ranked book ids stored per student by the batch job
+RECOMMENDATION_PRECOMPUTE_CHUNK = 500  # students scored per Celery subtask
+RECOMMENDATION_CACHE_TTL = 3600  # seconds a cached ranking is served before re-reading the snapshot
+
+# Catalog search: 'postgres' (stored tsvector), 'memory' (in-process BM25 index) or 'auto' to pick by database
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+SEARCH_INDEX_SNAPSHOT = BASE_DIR / "var" / "search_index.pickle"  # written by `manage.py build_search_index`
+SEARCH_MAX_RESULTS = 1000
+SEARCH_RESULTS_CACHE_TTL = 300  # seconds a query's ranked id list is reused for paging
+FACET_CACHE_TTL = 300  # seconds advanced-search facet counts are reused (Book writes invalidate sooner)
+
+# Dashboards
+KPI_CACHE_TTL = 60  # seconds the admin/librarian/student KPI aggregates are reused
+
+# Reports
+REPORT_ROWS_PER_TABLE = 40  # transactions per PDF table; roughly one page each
+
+# Reminders
+REMINDER_BATCH_SIZE = 200  # emails per send_messages() call on one connection
+REMINDER_CHUNK_SIZE = 1000  # students per overdue-reminder Celery subtask
+REMINDER_LOG_RETENTION_DAYS = 30  # days of sent-reminder ledger kept for de-duplication
 
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = 'home'
@@ -285,6 +324,12 @@ AUTH_PASSWORD_VALIDATORS += [
 ]
 
 # Logging configuration
+# Test runs log errors to a scratch file, so they never write to the tracked logs/django_error.log
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+ERROR_LOG_FILE = (
+    Path(tempfile.gettempdir()) / 'anu_lms_test_error.log' if TESTING else BASE_DIR / 'logs' / 'django_error.log'
+)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -302,7 +347,7 @@ LOGGING = {
         'file': {
             'level': 'ERROR',
             'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'logs' / 'django_error.log',
+            'filename': ERROR_LOG_FILE,
             'formatter': 'verbose',
         },
         'console': {
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def clamp_available_copies(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Book.objects.filter(available_copies__gt=F('total_copies')).update(available_copies=F('total_copies'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_alter_book_id_alter_department_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_available_copies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(check=models.Q(('available_copies__lte', models.F('total_copies'))), name='books_book_available_lte_total', violation_error_message='Available copies cannot exceed total copies.'),
+        ),
+    ]
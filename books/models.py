@@ -20,5 +20,14 @@ class Book(models.Model):
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     is_featured = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(available_copies__lte=models.F('total_copies')),
+                name='books_book_available_lte_total',
+                violation_error_message='Available copies cannot exceed total copies.',
+            ),
+        ]
+
     def __str__(self):
         return self.title
@@ -3,7 +3,9 @@ from django.db.models import Q
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction as db_transaction
 from datetime import datetime, timedelta
+from portal.services.circulation import CirculationError, release_copy, take_copy
 from .models import Book, Department
 from transactions.models import Transaction, BookRequest
 
@@ -155,15 +157,19 @@ def issue_book(request, pk):
         messages.warning(request, 'User already has this book issued.')
         return redirect('book_detail', pk=pk)
 
-    # Create transaction
+    # Take the copy and create the transaction together, so concurrent issues cannot oversell
     due_date = datetime.now().date() + timedelta(days=14)  # 14 days loan period
-    Transaction.objects.create(
-        user=request.user,
-        book=book,
-        due_date=due_date
-    )
-    book.available_copies -= 1
-    book.save()
+    try:
+        with db_transaction.atomic():
+            take_copy(book)
+            Transaction.objects.create(
+                user=request.user,
+                book=book,
+                due_date=due_date
+            )
+    except CirculationError as exc:
+        messages.error(request, str(exc))
+        return redirect('book_detail', pk=pk)
     messages.success(request, f'Book issued successfully. Due date: {due_date}')
     return redirect('book_detail', pk=pk)
 
@@ -181,15 +187,13 @@ def return_book(request, pk):
         messages.error(request, 'No active transaction found for this book.')
         return redirect('book_detail', pk=pk)
 
-    # Mark transaction as returned
-    transaction.return_date = datetime.now()
-    transaction.is_returned = True
-    transaction.calculate_fine()
-    transaction.save()
-
-    # Increase available copies
-    book.available_copies += 1
-    book.save()
+    # Mark transaction as returned and put the copy back in one transaction
+    with db_transaction.atomic():
+        transaction.return_date = datetime.now()
+        transaction.is_returned = True
+        transaction.calculate_fine()
+        transaction.save()
+        release_copy(book)
 
     messages.success(request, f'Book returned successfully. Fine: ${transaction.fine_amount}')
     return redirect('book_detail', pk=pk)
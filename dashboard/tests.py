@@ -34,3 +34,17 @@ class DashboardViewsTest(TestCase):
         self.client.login(username='admin_test', password='password123')
         response = self.client.get('/dashboard/')
         self.assertIn(response.status_code, [200, 302, 403])
+
+    def test_export_csv_streams_transactions(self):
+        from django.utils import timezone
+        from books.models import Book, Department as LegacyDepartment
+        from transactions.models import Transaction
+        dept = LegacyDepartment.objects.create(name='Legacy CS')
+        book = Book.objects.create(title='Algorithms', author='Cormen', isbn='9780262033848', department=dept)
+        Transaction.objects.create(user=self.student_user, book=book, due_date=timezone.now())
+        self.client.force_login(self.admin_user)
+        response = self.client.get('/dashboard/export/csv/', {'department': dept.id})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'User,Book,Department,Issue Date,Due Date,Return Date,Fine')
+        self.assertTrue(lines[1].startswith('student_test,Algorithms,Legacy CS,'))
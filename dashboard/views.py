@@ -6,7 +6,8 @@ from django.utils import timezone
 from books.models import Book, Department
 from transactions.models import Transaction
 from accounts.models import UserProfile
-import csv
+from portal.services.exports import EXPORT_CHUNK_SIZE, streaming_csv_response
+from portal.utils import issued_between, parse_date_range
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from io import BytesIO
@@ -50,25 +51,21 @@ def export_csv(request):
     if not request.user.is_staff and user_role != 'librarian':
         return HttpResponse('Forbidden', status=403)
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
+    start_date, end_date = parse_date_range(request.GET)
+    department = request.GET.get('department', '')
+    transactions = Transaction.objects.filter(**issued_between('issue_date', start_date, end_date)).order_by('id')
+    if department.isdigit():
+        transactions = transactions.filter(book__department_id=department)
+    rows = transactions.values_list(
+        'user__username', 'book__title', 'book__department__name', 'issue_date', 'due_date', 'return_date', 'fine_amount',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
 
-    writer = csv.writer(response)
-    writer.writerow(['User', 'Book', 'Department', 'Issue Date', 'Due Date', 'Return Date', 'Fine'])
-
-    transactions = Transaction.objects.all().select_related('user', 'book__department')
-    for t in transactions:
-        writer.writerow([
-            t.user.username,
-            t.book.title,
-            t.book.department.name,
-            t.issue_date,
-            t.due_date,
-            t.return_date or '',
-            t.fine_amount,
-        ])
-
-    return response
+    return streaming_csv_response(
+        'transactions.csv',
+        ['User', 'Book', 'Department', 'Issue Date', 'Due Date', 'Return Date', 'Fine'],
+        rows,
+        formatter=lambda row: (*row[:5], row[5] or '', row[6]),
+    )
 
 @login_required
 def export_pdf(request):
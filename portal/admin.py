@@ -9,6 +9,7 @@ from .models import (
     Eresource,
     BookReservation,
     InterLibraryLoanRequest,
+    Notification,
 )
 
 @admin.register(Book)
@@ -65,3 +66,10 @@ class InterLibraryLoanRequestAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'author', 'isbn', 'status', 'requested_on')
     search_fields = ('title', 'user__username', 'author', 'isbn')
     list_filter = ('status', 'requested_on')
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('title', 'group', 'status', 'attempts', 'created_at', 'pushed_at', 'emailed_at')
+    search_fields = ('title', 'group', 'user__username')
+    list_filter = ('status', 'type_status', 'created_at')
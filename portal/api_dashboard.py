@@ -1,19 +1,18 @@
+from datetime import date
+
 from django.http import JsonResponse
-from django.db.models import Count, F
-from django.db.models.functions import TruncMonth
+from django.db.models import Count
 from django.utils import timezone
 from .models import Book, Transaction, Department
+from .services.popularity import most_issued
+from .services.rollup import issues_per_department, issues_per_month
+from .utils import parse_date_range
 
 def chart_issues_per_department(request):
-    data = (
-        Transaction.objects
-        .values(dept_name=F("book__department__name"))
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
+    data = issues_per_department(*parse_date_range(request.GET))
 
-    labels = [d["dept_name"] or "Unknown" for d in data]
-    values = [d["total"] for d in data]
+    labels = [name or "Unknown" for name, _ in data]
+    values = [total for _, total in data]
 
     return JsonResponse({"labels": labels, "values": values})
 
@@ -21,29 +20,19 @@ def chart_issues_per_department(request):
 def chart_issues_per_month(request):
     year = int(request.GET.get("year", timezone.now().year))
 
-    qs = (
-        Transaction.objects.filter(issued_on__year=year)
-        .annotate(month=TruncMonth("issued_on"))
-        .values("month")
-        .annotate(total=Count("id"))
-        .order_by("month")
-    )
+    qs = issues_per_month(date(year, 1, 1), date(year, 12, 31))
 
-    labels = [d["month"].strftime("%b") for d in qs]
-    values = [d["total"] for d in qs]
+    labels = [month.strftime("%b") for month, _ in qs]
+    values = [total for _, total in qs]
 
     return JsonResponse({"labels": labels, "values": values})
 
 
 def chart_top_books(request):
-    qs = (
-        Transaction.objects.values("book__title")
-        .annotate(total=Count("id"))
-        .order_by("-total")[:10]
-    )
+    top = most_issued(limit=10)
 
-    labels = [b["book__title"] for b in qs]
-    values = [b["total"] for b in qs]
+    labels = [b["book__title"] for b in top]
+    values = [b["total_issues"] for b in top]
 
     return JsonResponse({"labels": labels, "values": values})
 
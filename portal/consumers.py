@@ -1,6 +1,12 @@
 import json
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from .services.notifications import inbox_item, latest_sequence, missed_notifications
+
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         if self.scope["user"].is_anonymous:
@@ -24,6 +30,24 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             )
 
         await self.accept()
+        await self.replay_missed()
+
+    async def replay_missed(self):
+        """
+        Send what arrived while the socket was away, after the ``last_seen`` sequence number in the query string.
+
+        Without a cursor (a first visit) nothing is replayed; the client is
+        told the current sequence number to start counting from instead.
+        """
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        last_seen = query.get("last_seen", [""])[0]
+        user_id = self.scope["user"].pk
+        if not last_seen.isdigit():
+            last_seq = await database_sync_to_async(latest_sequence)(user_id)
+            await self.send(text_data=json.dumps({'event': 'cursor', 'last_seq': last_seq}))
+            return
+        for notification in await database_sync_to_async(missed_notifications)(user_id, int(last_seen)):
+            await self.send(text_data=json.dumps({**inbox_item(notification), 'replayed': True}))
 
     async def disconnect(self, close_code):
         if hasattr(self, 'user_group_name'):
@@ -45,7 +69,17 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
+            'id': event.get('id'),
+            'seq': event.get('seq'),
             'message': message,
             'title': title,
             'type': type
         }))
+
+    # Live librarian dashboard update, sent to the 'librarians' group only
+    async def dashboard_delta(self, event):
+        await self.send(text_data=json.dumps({
+            'event': 'dashboard',
+            'id': event.get('id'),
+            'delta': event['delta'],
+        }))
@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from portal.models import Book, Transaction
+from portal.services.reminders import send_due_date_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the due-date reminder run against synthetic active loans. "
+        "Everything it creates is rolled back and no email leaves the process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=100000, help="Active loans to generate (default: 100000)")
+        parser.add_argument('--users', type=int, default=2000, help="Borrowers to spread them over (default: 2000)")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Batch size for bulk_create (default: 5000)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['loans'], options['users'], options['batch_size'])
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                for label in ('first run', 're-run'):
+                    mail.outbox = []
+                    self.run(label)
+            transaction.set_rollback(True)
+
+    def seed(self, loans, users, batch_size):
+        started = time.monotonic()
+        today = timezone.localdate()
+        borrowers = User.objects.bulk_create(
+            [User(username=f'reminder_bench_{i}', email=f'reminder_bench_{i}@example.com') for i in range(users)],
+            batch_size=batch_size,
+        )
+        if borrowers and borrowers[0].pk is None:
+            borrowers = list(User.objects.filter(username__startswith='reminder_bench_'))
+        book = Book.objects.create(title='Reminder Benchmark', isbn='BENCH-REMINDERS')
+        # Due dates spread over the next 30 days, so about one loan in fifteen is in a reminder bucket
+        Transaction.objects.bulk_create(
+            (
+                Transaction(user=borrowers[i % len(borrowers)], book=book, due_date=today + timedelta(days=i % 30))
+                for i in range(loans)
+            ),
+            batch_size=batch_size,
+        )
+        self.stdout.write(f"Seeded {loans} active loans for {users} borrowers in {time.monotonic() - started:.2f}s.")
+
+    def run(self, label):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.monotonic()
+            counts = send_due_date_reminders()
+            elapsed = time.monotonic() - started
+        sent = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {counts[3]} 3-day and {counts[1]} 1-day reminders ({len(mail.outbox)} emails) "
+            f"in {elapsed:.2f}s, {len(queries)} queries, {sent / elapsed if elapsed else sent:.0f} reminders/s."
+        ))
@@ -0,0 +1,196 @@
+import asyncio
+import time
+import tracemalloc
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from portal.services.reminders import chunked
+
+USERNAME_PREFIX = 'ws_bench_'
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def percentiles(samples):
+    """``p50/p95/p99/max`` of ``samples`` (seconds) as a millisecond summary string."""
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+
+    def at(q):
+        return samples[min(len(samples) - 1, round(q * (len(samples) - 1)))] * 1000
+
+    return f"p50 {at(0.5):.1f}ms, p95 {at(0.95):.1f}ms, p99 {at(0.99):.1f}ms, max {samples[-1] * 1000:.1f}ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test NotificationConsumer through the ASGI app in anu_lms/asgi.py: open many "
+        "session-authenticated sockets, fan out 'librarians' broadcasts and per-user messages, and "
+        "report connect latency, delivery latency percentiles and memory per connection. Uses the "
+        "in-memory channel layer unless --layer=configured. The users and sessions it creates are "
+        "deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000, help="WebSocket clients to open (default: 2000)")
+        parser.add_argument('--staff', type=int, default=100, help="Clients that join 'librarians' (default: 100)")
+        parser.add_argument('--broadcasts', type=int, default=20, help="'librarians' broadcasts (default: 20)")
+        parser.add_argument('--user-messages', type=int, default=2, help="Messages per client (default: 2)")
+        parser.add_argument('--concurrency', type=int, default=200, help="Sockets connecting at once (default: 200)")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds to wait on any one socket")
+        parser.add_argument(
+            '--layer', choices=['memory', 'configured'], default='memory',
+            help="Channel layer: in-memory (default) or the one in settings, e.g. Redis",
+        )
+        parser.add_argument('--skip-memory', action='store_true', help="Skip tracemalloc (faster, no memory figure)")
+
+    def handle(self, *args, **options):
+        options['staff'] = min(options['staff'], options['clients'])
+        sessions = self.seed(options['clients'], options['staff'])
+        layers = IN_MEMORY_CHANNEL_LAYERS if options['layer'] == 'memory' else settings.CHANNEL_LAYERS
+        try:
+            with override_settings(CHANNEL_LAYERS=layers):
+                async_to_sync(self.run)(sessions, options)
+        finally:
+            Session.objects.filter(session_key__in=[key for key, _, _ in sessions]).delete()
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def seed(self, clients, staff):
+        """Create ``clients`` users (the first ``staff`` of them staff) with a logged-in session each."""
+        started = time.monotonic()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{i}', password=password, is_staff=i < staff) for i in range(clients)],
+            batch_size=1000,
+        )
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk'))
+        store = SessionStore()
+        expire_date = timezone.now() + timedelta(days=1)
+        sessions, rows = [], []
+        for user in users:
+            key = get_random_string(32, 'abcdefghijklmnopqrstuvwxyz0123456789')
+            rows.append(Session(
+                session_key=key,
+                session_data=store.encode({
+                    '_auth_user_id': str(user.pk),
+                    '_auth_user_backend': 'django.contrib.auth.backends.ModelBackend',
+                    '_auth_user_hash': user.get_session_auth_hash(),
+                }),
+                expire_date=expire_date,
+            ))
+            sessions.append((key, user.username, user.is_staff))
+        Session.objects.bulk_create(rows, batch_size=1000)
+        self.stdout.write(f"Seeded {clients} users ({staff} staff) with sessions in {time.monotonic() - started:.2f}s.")
+        return sessions
+
+    async def run(self, sessions, options):
+        from anu_lms.asgi import application
+
+        timeout = options['timeout']
+        if not options['skip_memory']:
+            tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+        connect_times, clients = [], []
+
+        async def connect(key, username, is_staff):
+            communicator = WebsocketCommunicator(
+                application, '/ws/notifications/', headers=[(b'cookie', f'{settings.SESSION_COOKIE_NAME}={key}'.encode())],
+            )
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=timeout)
+            if not connected:
+                return
+            # A first connect (no last_seen) is answered with the inbox cursor
+            await communicator.receive_json_from(timeout=timeout)
+            connect_times.append(time.perf_counter() - started)
+            clients.append((communicator, username, is_staff))
+
+        started = time.perf_counter()
+        for wave in chunked(sessions, options['concurrency']):
+            await asyncio.gather(*(connect(*session) for session in wave))
+        connect_elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Connected {len(clients)}/{len(sessions)} sockets in {connect_elapsed:.2f}s "
+            f"({len(clients) / connect_elapsed:.0f}/s); connect latency {percentiles(connect_times)}."
+        )
+        if tracemalloc.is_tracing():
+            per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / max(len(clients), 1)
+            tracemalloc.stop()
+            self.stdout.write(
+                f"Memory: {per_connection / 1024:.1f} KiB per connection "
+                "(Python heap, consumer plus test client)."
+            )
+
+        try:
+            await self.deliver(clients, options)
+        finally:
+            await asyncio.gather(*(communicator.disconnect() for communicator, _, _ in clients))
+
+    async def deliver(self, clients, options):
+        """Broadcast to 'librarians', then message every client's own group, timing each delivery."""
+        channel_layer = get_channel_layer()
+        timeout = options['timeout']
+        sent_at, latencies = {}, {'broadcast': [], 'user': []}
+        missed = 0
+
+        async def read(communicator, expected):
+            nonlocal missed
+            for _ in range(expected):
+                try:
+                    message = await communicator.receive_json_from(timeout=timeout)
+                except asyncio.TimeoutError:
+                    missed += 1
+                    continue
+                kind, started = sent_at[message['id']]
+                latencies[kind].append(time.perf_counter() - started)
+
+        readers = [
+            asyncio.ensure_future(
+                read(communicator, options['user_messages'] + (options['broadcasts'] if is_staff else 0))
+            )
+            for communicator, _, is_staff in clients
+        ]
+
+        async def send(kind, group, seq):
+            sent_at[seq] = (kind, time.perf_counter())
+            await channel_layer.group_send(group, {
+                'type': 'notification.message',
+                'id': seq,
+                'title': 'Benchmark',
+                'message': f'{kind} message {seq}',
+                'type_status': 'info',
+            })
+
+        started = time.perf_counter()
+        seq = 0
+        for _ in range(options['broadcasts']):
+            seq += 1
+            await send('broadcast', 'librarians', seq)
+        for _ in range(options['user_messages']):
+            for _, username, _ in clients:
+                seq += 1
+                await send('user', f'user_{username}', seq)
+        await asyncio.gather(*readers)
+        elapsed = time.perf_counter() - started
+
+        delivered = len(latencies['broadcast']) + len(latencies['user'])
+        self.stdout.write(f"Broadcast deliveries: {len(latencies['broadcast'])}, latency {percentiles(latencies['broadcast'])}.")
+        self.stdout.write(f"Per-user deliveries: {len(latencies['user'])}, latency {percentiles(latencies['user'])}.")
+        summary = (
+            f"Delivered {delivered} messages in {elapsed:.2f}s "
+            f"({delivered / elapsed if elapsed else delivered:.0f}/s), {missed} missed."
+        )
+        self.stdout.write(self.style.SUCCESS(summary) if not missed else self.style.WARNING(summary))
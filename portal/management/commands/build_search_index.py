@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from portal.services.search import InMemorySearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Build the in-memory catalog search index and write its snapshot for fast worker start-up."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Snapshot file (defaults to settings.SEARCH_INDEX_SNAPSHOT).")
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not isinstance(backend, InMemorySearchBackend):
+            self.stdout.write("Catalog search uses the PostgreSQL search vector; no snapshot needed.")
+            return
+        path = options['path'] or backend.snapshot_path
+        if not path:
+            raise CommandError("No snapshot path given and settings.SEARCH_INDEX_SNAPSHOT is not set.")
+        books = backend.save_snapshot(path)
+        self.stdout.write(self.style.SUCCESS("Indexed %d books into %s." % (books, path)))
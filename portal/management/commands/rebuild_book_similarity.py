@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from portal.services.similarity import rebuild_similarity_matrix, SIMILARITY_TOP_K
+
+
+class Command(BaseCommand):
+    help = "Rebuild the item-item co-borrow table used by the recommender."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=SIMILARITY_TOP_K,
+            help="Neighbours kept per book (default: %d)" % SIMILARITY_TOP_K,
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_similarity_matrix(top_k=options["top_k"])
+        self.stdout.write(self.style.SUCCESS("Rebuilt book similarity table with %d rows." % rows))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from portal.services.popularity import reconcile_popularity
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalised book popularity counters from the transaction history."
+
+    def handle(self, *args, **options):
+        books = reconcile_popularity()
+        self.stdout.write(self.style.SUCCESS("Reconciled popularity counters for %d books." % books))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from portal.services.rollup import rollup_history, rollup_recent
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily circulation rollup used by the analytics charts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Only recompute the last N days (default: the whole history).")
+
+    def handle(self, *args, **options):
+        if options['days']:
+            rows = rollup_recent(options['days'])
+        else:
+            rows = rollup_history()
+        self.stdout.write(self.style.SUCCESS("Wrote %d daily circulation rows." % rows))
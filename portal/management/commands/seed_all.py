@@ -63,6 +63,12 @@ class Command(BaseCommand):
             try:
                 call_command("generate_transactions", count=tx_count)
                 self.stdout.write(self.style.SUCCESS("  [OK] Transactions generated"))
+                call_command("rebuild_book_similarity")
+                self.stdout.write(self.style.SUCCESS("  [OK] Book similarity table rebuilt"))
+                call_command("reconcile_popularity")
+                self.stdout.write(self.style.SUCCESS("  [OK] Popularity counters reconciled"))
+                call_command("rollup_circulation")
+                self.stdout.write(self.style.SUCCESS("  [OK] Daily circulation rollup rebuilt"))
             except Exception as e:
                 self.stderr.write(self.style.ERROR("  [FAIL] Transaction generation failed: %s" % e))
         else:
@@ -1,49 +1,25 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.core.mail import send_mail
-from portal.models import Transaction
-from portal.utils import calculate_fine
+from portal.services.reminders import REMINDER_CHUNK_SIZE, chunked, overdue_user_ids, send_overdue_digests
 
 class Command(BaseCommand):
-    help = "Send overdue reminder emails to students"
+    help = "Send each student one digest email listing all of their overdue books"
 
     def handle(self, *args, **kwargs):
         today = timezone.localdate()
+        user_ids = overdue_user_ids(today)
 
-        overdue_transactions = Transaction.objects.filter(
-            returned_on__isnull=True,
-            due_date__lt=today
-        ).select_related("user", "book")
-
-        if not overdue_transactions:
+        if not user_ids:
             self.stdout.write(self.style.SUCCESS("No overdue books today."))
             return
 
-        for tx in overdue_transactions:
-            fine = calculate_fine(tx.due_date, today)
-
-            subject = f"Overdue Book Reminder – '{tx.book.title}'"
-            message = (
-                f"Dear {tx.user.username},\n\n"
-                f"The book '{tx.book.title}' issued to you was due on {tx.due_date}.\n"
-                f"Today's date: {today}\n"
-                f"Days overdue: {(today - tx.due_date).days}\n"
-                f"Current estimated fine: ₹{fine}\n\n"
-                "Please return the book as soon as possible.\n\n"
-                "— Acharya Nagarjuna University Library"
-            )
-
-            if tx.user.email:
-                send_mail(
-                    subject,
-                    message,
-                    "library@anu.ac.in",
-                    [tx.user.email],
-                    fail_silently=True
-                )
-
-            self.stdout.write(
-                self.style.WARNING(f"Email sent to {tx.user.email} about '{tx.book.title}'")
-            )
+        totals = {'sent': 0, 'loans': 0, 'seconds': 0}
+        for chunk in chunked(user_ids, REMINDER_CHUNK_SIZE):
+            stats = send_overdue_digests(chunk, today)
+            for key in totals:
+                totals[key] += stats[key]
 
-        self.stdout.write(self.style.SUCCESS("Overdue reminder task finished."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Overdue reminder task finished: {totals['sent']} digests covering {totals['loans']} loans "
+            f"sent to {len(user_ids)} students in {totals['seconds']:.2f}s."
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from portal.models import Book
+from portal.services.search import book_search_vector, uses_postgres_search
+
+
+class Command(BaseCommand):
+    help = "Backfill the stored full-text search vector on every book (PostgreSQL only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Books updated per UPDATE statement (default: 2000)",
+        )
+
+    def handle(self, *args, **options):
+        if not uses_postgres_search():
+            self.stdout.write(self.style.WARNING("Full-text search vectors are only stored on PostgreSQL; nothing to do."))
+            return
+
+        batch_size = options["batch_size"]
+        ids = list(Book.objects.order_by("id").values_list("id", flat=True))
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            updated += Book.objects.filter(id__gte=batch[0], id__lte=batch[-1]).update(search_vector=book_search_vector())
+            self.stdout.write("Updated %d/%d books" % (updated, len(ids)))
+
+        self.stdout.write(self.style.SUCCESS("Search vectors backfilled for %d books." % updated))
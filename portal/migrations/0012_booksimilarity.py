@@ -0,0 +1,46 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_similarity(apps, schema_editor):
+    # The nightly rebuild's own computation, run over the historical models
+    from portal.services.similarity import borrow_pairs, co_borrow_neighbours
+    Transaction = apps.get_model('portal', 'Transaction')
+    BookSimilarity = apps.get_model('portal', 'BookSimilarity')
+    BookSimilarity.objects.bulk_create(
+        [
+            BookSimilarity(book_id=book_id, similar_book_id=other_id, score=count)
+            for book_id, other_id, count in co_borrow_neighbours(borrow_pairs(Transaction))
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0011_eresource_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='portal.book')),
+                ('similar_book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='portal.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', '-score'], name='booksim_book_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='booksimilarity',
+            constraint=models.UniqueConstraint(fields=('book', 'similar_book'), name='unique_book_similarity'),
+        ),
+        migrations.RunPython(backfill_similarity, migrations.RunPython.noop),
+    ]
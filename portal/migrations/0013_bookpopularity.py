@@ -0,0 +1,50 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_popularity(apps, schema_editor):
+    Transaction = apps.get_model('portal', 'Transaction')
+    BookPopularity = apps.get_model('portal', 'BookPopularity')
+    now = timezone.now()
+    stats = (
+        Transaction.objects.values('book_id')
+        .annotate(
+            issue_count=Count('id'),
+            issues_30d=Count('id', filter=Q(issued_on__gte=now - timedelta(days=30))),
+            issues_90d=Count('id', filter=Q(issued_on__gte=now - timedelta(days=90))),
+            active_loans=Count('id', filter=Q(returned_on__isnull=True)),
+        )
+        .order_by()
+    )
+    BookPopularity.objects.bulk_create(
+        [BookPopularity(reconciled_at=now, **row) for row in stats],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0012_booksimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPopularity',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='portal.book')),
+                ('issue_count', models.PositiveIntegerField(db_index=True, default=0)),
+                ('issues_30d', models.PositiveIntegerField(default=0)),
+                ('issues_90d', models.PositiveIntegerField(default=0)),
+                ('active_loans', models.PositiveIntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
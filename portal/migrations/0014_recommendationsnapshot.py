@@ -0,0 +1,25 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('portal', '0013_bookpopularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationSnapshot',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation_snapshot', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('book_ids', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
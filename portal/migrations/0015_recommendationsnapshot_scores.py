@@ -0,0 +1,18 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0014_recommendationsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationsnapshot',
+            name='scores',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The trigger, GIN index and backfill only exist on PostgreSQL; other
+# backends keep an unused column and search through the fallback paths.
+CREATE_SQL = """
+CREATE INDEX portal_book_search_vector_gin ON portal_book USING gin (search_vector);
+
+CREATE OR REPLACE FUNCTION portal_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.subject, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER portal_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, subject, description, search_vector
+    ON portal_book
+    FOR EACH ROW EXECUTE FUNCTION portal_book_search_vector_update();
+
+UPDATE portal_book SET search_vector = NULL;
+"""
+
+DROP_SQL = """
+DROP TRIGGER IF EXISTS portal_book_search_vector_trigger ON portal_book;
+DROP FUNCTION IF EXISTS portal_book_search_vector_update();
+DROP INDEX IF EXISTS portal_book_search_vector_gin;
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0015_recommendationsnapshot_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations
+
+# Trigram indexes on UPPER(title/author) serve Django's istartswith/icontains
+# lookups (UPPER(col) LIKE UPPER(...)) for search suggestions. Only created on
+# PostgreSQL servers that ship the pg_trgm extension.
+CREATE_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS portal_book_title_trgm ON portal_book USING gin (UPPER(title) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS portal_book_author_trgm ON portal_book USING gin (UPPER(author) gin_trgm_ops);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS portal_book_title_trgm;
+DROP INDEX IF EXISTS portal_book_author_trgm;
+"""
+
+
+def has_pg_trgm(schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if has_pg_trgm(schema_editor):
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0016_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_circulation_stats(apps, schema_editor):
+    Transaction = apps.get_model('portal', 'Transaction')
+    DailyCirculationStat = apps.get_model('portal', 'DailyCirculationStat')
+    group = {'department_id': F('book__department_id'), 'category_id': F('book__category_id')}
+    buckets = defaultdict(lambda: {'issues': 0, 'returns': 0, 'overdues': 0, 'fines': 0})
+
+    issued = Transaction.objects.values(day=TruncDate('issued_on'), **group).annotate(n=Count('id')).order_by()
+    for row in issued:
+        buckets[row['day'], row['department_id'], row['category_id']]['issues'] += row['n']
+
+    returned = (
+        Transaction.objects.filter(returned_on__isnull=False)
+        .values(day=F('returned_on'), **group)
+        .annotate(n=Count('id'), total_fines=Sum('fine_amount'))
+        .order_by()
+    )
+    for row in returned:
+        bucket = buckets[row['day'], row['department_id'], row['category_id']]
+        bucket['returns'] += row['n']
+        bucket['fines'] += row['total_fines'] or 0
+
+    overdue = (
+        Transaction.objects.filter(due_date__lt=timezone.localdate())
+        .filter(Q(returned_on__isnull=True) | Q(returned_on__gt=F('due_date')))
+        .values(day=F('due_date'), **group)
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in overdue:
+        buckets[row['day'], row['department_id'], row['category_id']]['overdues'] += row['n']
+
+    DailyCirculationStat.objects.bulk_create(
+        [
+            DailyCirculationStat(date=day, department_id=department_id, category_id=category_id, **counters)
+            for (day, department_id, category_id), counters in buckets.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0018_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCirculationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('issues', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdues', models.PositiveIntegerField(default=0)),
+                ('fines', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.bookcategory')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.department')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'department', 'category'], name='circstat_date_dept_cat_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_circulation_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0020_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('DUE_3', 'Due in 3 days'), ('DUE_1', 'Due tomorrow'), ('OVERDUE', 'Overdue')], max_length=10)),
+                ('sent_on', models.DateField()),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='portal.transaction')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reminderlog',
+            constraint=models.UniqueConstraint(fields=('transaction', 'kind', 'sent_on'), name='unique_reminder_per_day'),
+        ),
+    ]
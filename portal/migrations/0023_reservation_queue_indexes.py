@@ -0,0 +1,21 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0022_book_available_lte_total'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookreservation',
+            index=models.Index(fields=['book', 'status', 'created_at'], name='reservation_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ),
+    ]
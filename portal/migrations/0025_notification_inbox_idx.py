@@ -0,0 +1,17 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0024_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'id'], name='notification_inbox_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0025_notification_inbox_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(choices=[('MESSAGE', 'Message'), ('DASHBOARD', 'Dashboard delta')], default='MESSAGE', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
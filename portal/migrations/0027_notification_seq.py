@@ -0,0 +1,37 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+
+
+def number_existing_notifications(apps, schema_editor):
+    Notification = apps.get_model('portal', 'Notification')
+    last = {}
+    rows = []
+    for notification in Notification.objects.filter(user__isnull=False).order_by('user_id', 'id').only('id', 'user_id'):
+        last[notification.user_id] = notification.seq = last.get(notification.user_id, 0) + 1
+        rows.append(notification)
+    Notification.objects.bulk_update(rows, ['seq'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0026_notification_kind_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(number_existing_notifications, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_inbox_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('user', 'seq'), name='unique_notification_seq_per_user'),
+        ),
+    ]
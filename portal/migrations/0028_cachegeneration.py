@@ -0,0 +1,20 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0027_notification_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.29 on 2026-10-18
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+import django.db.models.functions.comparison
+
+
+def merge_duplicate_buckets(apps, schema_editor):
+    # Racing writers could create the same bucket twice; fold each set of duplicates into its oldest row
+    DailyCirculationStat = apps.get_model('portal', 'DailyCirculationStat')
+    duplicates = (
+        DailyCirculationStat.objects.values('date', 'department_id', 'category_id')
+        .annotate(rows=Count('id'), keep=Min('id'), issues_total=Sum('issues'), returns_total=Sum('returns'),
+                  overdues_total=Sum('overdues'), fines_total=Sum('fines'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for bucket in duplicates:
+        DailyCirculationStat.objects.filter(pk=bucket['keep']).update(
+            issues=bucket['issues_total'], returns=bucket['returns_total'],
+            overdues=bucket['overdues_total'], fines=bucket['fines_total'],
+        )
+        DailyCirculationStat.objects.filter(
+            date=bucket['date'], department_id=bucket['department_id'], category_id=bucket['category_id'],
+        ).exclude(pk=bucket['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0028_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_buckets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailycirculationstat',
+            constraint=models.UniqueConstraint(
+                models.F('date'),
+                django.db.models.functions.comparison.Coalesce('department', models.Value(0)),
+                django.db.models.functions.comparison.Coalesce('category', models.Value(0)),
+                name='unique_circstat_bucket',
+            ),
+        ),
+    ]
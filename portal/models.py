@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from decimal import Decimal
 
@@ -52,6 +54,26 @@ class Book(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Weighted title/author/subject/description document. On PostgreSQL a
+    # trigger keeps it current and a GIN index backs it (migration 0016).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination keys (portal.services.pagination.CursorPaginator)
+            models.Index(fields=['created_at', 'id'], name='book_created_id_idx'),
+            models.Index(fields=['department', 'created_at', 'id'], name='book_dept_created_id_idx'),
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
+        constraints = [
+            # available_copies >= 0 comes with PositiveIntegerField; circulation updates rely on both bounds.
+            models.CheckConstraint(
+                check=models.Q(available_copies__lte=models.F('total_copies')),
+                name='book_available_lte_total',
+                violation_error_message='Available copies cannot exceed total copies.',
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -147,13 +169,28 @@ class Eresource(models.Model):
         return self.name
 
 class BookReservation(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
-    status = models.CharField(max_length=20, choices=[('WAITING', 'Waiting'), ('AVAILABLE', 'Available'), ('CANCELLED', 'Cancelled')], default='WAITING')
+    STATUS_CHOICES = (
+        ('WAITING', 'Waiting'),
+        ('AVAILABLE', 'Available'),
+        ('FULFILLED', 'Fulfilled'),
+        ('CANCELLED', 'Cancelled'),
+        ('EXPIRED', 'Expired'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='WAITING', db_index=True)
     available_at = models.DateTimeField(null=True, blank=True)
     expires_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Next in line for a book: WHERE book = ? AND status = 'WAITING' ORDER BY created_at LIMIT 1
+            models.Index(fields=['book', 'status', 'created_at'], name='reservation_queue_idx'),
+            # Expiry sweep: WHERE status = 'AVAILABLE' AND expires_at < now
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ]
+
     def __str__(self):
         return f"{self.book.title} reserved by {self.user.username}"
 
@@ -166,3 +203,191 @@ class InterLibraryLoanRequest(models.Model):
     requested_on = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=[('PENDING', 'Pending'), ('IN_TRANSIT', 'In Transit'), ('AVAILABLE', 'Available'), ('COMPLETED', 'Completed'), ('REJECTED', 'Rejected')], default='PENDING')
     admin_notes = models.TextField(blank=True, null=True)
+
+
+class BookSimilarity(models.Model):
+    """Sparse item-item co-borrow table holding the top-K neighbours of each book."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similarities')
+    similar_book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField(default=0)  # distinct users who borrowed both books
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'similar_book'], name='unique_book_similarity'),
+        ]
+        indexes = [
+            models.Index(fields=['book', '-score'], name='booksim_book_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} ~ {self.similar_book_id} ({self.score})"
+
+
+class BookPopularity(models.Model):
+    """Denormalised circulation counters per book, maintained on issue/return."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    issue_count = models.PositiveIntegerField(default=0, db_index=True)
+    issues_30d = models.PositiveIntegerField(default=0)
+    issues_90d = models.PositiveIntegerField(default=0)
+    active_loans = models.PositiveIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.book_id}: {self.issue_count} issues"
+
+
+class RecommendationSnapshot(models.Model):
+    """Ranked recommendation book ids precomputed for a student by the batch job."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='recommendation_snapshot')
+    book_ids = models.JSONField(default=list)
+    scores = models.JSONField(default=list)  # parallel to book_ids
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Recommendations for {self.user_id} ({len(self.book_ids)} books)"
+
+
+class DailyCirculationStat(models.Model):
+    """
+    Per-day circulation totals for one department and book category.
+
+    Issues, returns and fines are folded in as loans change; overdues (loans
+    that ran past their due date) and any drift are settled by the nightly
+    rollup job, which recomputes the most recent days from Transaction.
+    """
+    date = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    category = models.ForeignKey(BookCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    issues = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    overdues = models.PositiveIntegerField(default=0)
+    fines = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'department', 'category'], name='circstat_date_dept_cat_idx'),
+        ]
+        constraints = [
+            # Coalesced so the untagged (NULL department/category) buckets are unique too
+            models.UniqueConstraint(
+                'date', Coalesce('department', models.Value(0)), Coalesce('category', models.Value(0)),
+                name='unique_circstat_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.issues} issues, {self.returns} returns"
+
+
+class ReportJob(models.Model):
+    """A report rendered in the background; ``file`` is set once the worker finishes."""
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_jobs')
+    kind = models.CharField(max_length=30, default='transactions_pdf')
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', db_index=True)
+    file = models.FileField(upload_to='reports/', blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class ReminderLog(models.Model):
+    """One row per reminder sent for a loan, so re-runs of the reminder tasks skip what went out already."""
+    KIND_CHOICES = (
+        ('DUE_3', 'Due in 3 days'),
+        ('DUE_1', 'Due tomorrow'),
+        ('OVERDUE', 'Overdue'),
+    )
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    sent_on = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'kind', 'sent_on'], name='unique_reminder_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.transaction_id} on {self.sent_on}"
+
+
+class Notification(models.Model):
+    """
+    A WebSocket (and optionally email) notification, written in the same
+    transaction as the change it announces and delivered later by the
+    outbox dispatcher. Rows with a ``user`` double as that user's inbox;
+    ``seq`` numbers them per user in commit order and is the cursor a
+    reconnecting socket replays from.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    )
+    TYPE_CHOICES = (
+        ('info', 'Info'),
+        ('success', 'Success'),
+        ('warning', 'Warning'),
+        ('error', 'Error'),
+    )
+    KIND_CHOICES = (
+        ('MESSAGE', 'Message'),
+        # Incremental update for the live librarian dashboard; ``payload`` carries the change
+        ('DASHBOARD', 'Dashboard delta'),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='MESSAGE')
+    payload = models.JSONField(default=dict, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    # Per-user sequence, assigned under a lock on the user row (see services.notifications.enqueue)
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
+    # Channel-layer group the event is pushed to: ``user_<username>`` or ``librarians``
+    group = models.CharField(max_length=160)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    type_status = models.CharField(max_length=10, choices=TYPE_CHOICES, default='info')
+    email = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    pushed_at = models.DateTimeField(null=True, blank=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Outbox drain: WHERE status = 'PENDING' AND next_attempt_at <= now ORDER BY id
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_outbox_idx'),
+        ]
+        constraints = [
+            # Also the inbox and reconnect replay index: WHERE user_id = %s AND seq > last_seen ORDER BY seq
+            models.UniqueConstraint(fields=['user', 'seq'], name='unique_notification_seq_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} -> {self.group} ({self.status})"
+
+
+class CacheGeneration(models.Model):
+    """
+    A named counter bumped whenever the data behind an in-process cache changes.
+
+    Kept in the database rather than the cache so every worker, and a
+    restarted one, sees the same value.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
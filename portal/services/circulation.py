@@ -0,0 +1,354 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, When
+from django.db.models.functions import Least
+from django.utils import timezone
+from portal.models import Book, BookRequest, BookReservation, Transaction
+from portal.services import live_dashboard, popularity, reservations, rollup
+from portal.services.facets import bump_facet_generation
+from portal.services.kpis import student_kpis_cache_key
+from portal.services.recommender import recommendation_cache_key
+from portal.services.similarity import record_borrows
+from portal.utils import calculate_fine
+
+LOAN_PERIOD_DAYS = 14
+# Most items accepted by one batch issue/return call
+BATCH_MAX_ITEMS = 500
+
+
+class CirculationError(Exception):
+    """An issue, return or hold that cannot go ahead; the message is fit to show the user."""
+
+
+def take_copy(book):
+    """
+    Decrement ``book``'s available copies in one conditional UPDATE.
+
+    The ``available_copies > 0`` guard and the decrement run as a single
+    statement, so concurrent checkouts can neither lose an update nor drive
+    the counter below zero. Works for any model with the two copy counters
+    (the legacy ``books.Book`` included). Raises ``CirculationError`` when
+    no copy is left.
+    """
+    taken = type(book)._default_manager.filter(pk=book.pk, available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1
+    )
+    if not taken:
+        raise CirculationError(f'No copies of "{book.title}" are available.')
+    _copies_changed({book.pk: -1} if isinstance(book, Book) else None)
+
+
+def release_copy(book):
+    """Increment ``book``'s available copies, never past ``total_copies``; returns whether a copy was added."""
+    released = type(book)._default_manager.filter(pk=book.pk, available_copies__lt=F('total_copies')).update(
+        available_copies=F('available_copies') + 1
+    )
+    if released:
+        _copies_changed({book.pk: 1} if isinstance(book, Book) else None)
+    return bool(released)
+
+
+def _copies_changed(book_changes=None):
+    # Availability is a facet; queryset updates skip the Book post_save signal that would bump it.
+    transaction.on_commit(bump_facet_generation)
+    # Catalog books only: the legacy books.Book is not on the librarian dashboard
+    live_dashboard.stock_changed(book_changes)
+
+
+def release_copies(book_counts):
+    """Return ``book_counts`` (book id -> copies) to the shelf in one grouped UPDATE, capped at ``total_copies``."""
+    if book_counts:
+        Book.objects.filter(pk__in=book_counts).update(available_copies=_grouped_copies(book_counts, +1))
+        _copies_changed(book_counts)
+
+
+def issue_loan(user, book, due_date=None):
+    """
+    Open a loan of ``book`` for ``user``, both or neither.
+
+    The copy comes off the shelf, or is the one already held for ``user``
+    by an AVAILABLE reservation, which is then FULFILLED.
+    """
+    with transaction.atomic():
+        if not reservations.fulfil_holds([(user.pk, book.pk)]):
+            take_copy(book)
+        return Transaction.objects.create(
+            user=user,
+            book=book,
+            due_date=due_date or timezone.localdate() + timedelta(days=LOAN_PERIOD_DAYS),
+        )
+
+
+def return_loan(loan, returned_on=None):
+    """
+    Close ``loan`` and put its copy back on the shelf, or on hold for the next reservation.
+
+    The loan row is locked first, so a double-submitted return is refused
+    instead of releasing two copies. Returns ``(loan, reservation)``, where
+    ``reservation`` is the hold the copy went to, if any.
+    """
+    returned_on = returned_on or timezone.localdate()
+    with transaction.atomic():
+        loan = Transaction.objects.select_for_update(of=('self',)).select_related('book').get(pk=loan.pk)
+        if loan.returned_on is not None:
+            raise CirculationError(f'"{loan.book.title}" has already been returned.')
+        loan.returned_on = returned_on
+        loan.fine_amount = calculate_fine(loan.due_date, returned_on)
+        loan.status = 'RETURNED'
+        loan.save(update_fields=['returned_on', 'fine_amount', 'status'])
+        live_dashboard.overdues_returned([loan])
+        reservation = reservations.promote_next(loan.book)
+        if reservation is None:
+            release_copy(loan.book)
+    return loan, reservation
+
+
+def approve_request(book_request):
+    """Approve a pending request: take a copy, open the loan and mark the request, all or nothing."""
+    with transaction.atomic():
+        book_request = (
+            BookRequest.objects.select_for_update(of=('self',)).select_related('book', 'user').get(pk=book_request.pk)
+        )
+        if book_request.status != 'PENDING':
+            raise CirculationError(f'The request for "{book_request.book.title}" has already been processed.')
+        loan = issue_loan(book_request.user, book_request.book)
+        book_request.status = 'APPROVED'
+        book_request.processed_at = timezone.now()
+        book_request.save(update_fields=['status', 'processed_at'])
+    return book_request, loan
+
+
+def cancel_reservation(reservation):
+    """
+    Cancel ``reservation``; a copy it was holding passes to the next waiting reservation or back to the shelf.
+
+    Returns the reservation the copy passed to, if any.
+    """
+    with transaction.atomic():
+        reservation = (
+            BookReservation.objects.select_for_update(of=('self',)).select_related('book').get(pk=reservation.pk)
+        )
+        next_reservation = None
+        if reservation.status == 'AVAILABLE':
+            next_reservation = reservations.promote_next(reservation.book, exclude=reservation)
+            if next_reservation is None:
+                release_copy(reservation.book)
+        if reservation.status in ('WAITING', 'AVAILABLE'):
+            reservation.status = 'CANCELLED'
+            reservation.save(update_fields=['status'])
+    return next_reservation
+
+
+def _resolve_items(items, results, active_members_only=False):
+    """
+    Resolve each item's borrower (``username`` or ``user_id``) and book (``book_id`` or ``isbn``) in two queries.
+
+    Returns ``{index: (user_id, book_id)}`` for the items that resolved;
+    the others get an ``error`` in ``results``.
+    """
+    def key(item, name):
+        value = item.get(name) if isinstance(item, dict) else None
+        return str(value).strip() if value not in (None, '') else None
+
+    usernames = {key(item, 'username') for item in items} - {None}
+    user_ids = {int(value) for value in (key(item, 'user_id') for item in items) if value and value.isdigit()}
+    isbns = {key(item, 'isbn') for item in items} - {None}
+    book_ids = {int(value) for value in (key(item, 'book_id') for item in items) if value and value.isdigit()}
+
+    users = User.objects.filter(Q(username__in=usernames) | Q(pk__in=user_ids))
+    if active_members_only:
+        users = users.filter(profile__is_active_member=True)
+    users_by_name, users_by_id = {}, set()
+    for user_id, username in users.values_list('pk', 'username'):
+        users_by_name[username] = user_id
+        users_by_id.add(user_id)
+    books_by_isbn, books_by_id = {}, set()
+    for book_id, isbn in Book.objects.filter(Q(isbn__in=isbns) | Q(pk__in=book_ids)).values_list('pk', 'isbn'):
+        books_by_isbn[isbn] = book_id
+        books_by_id.add(book_id)
+
+    resolved = {}
+    for index, item in enumerate(items):
+        username, user_key = key(item, 'username'), key(item, 'user_id')
+        user_id = users_by_name.get(username) if username else (
+            int(user_key) if user_key and user_key.isdigit() and int(user_key) in users_by_id else None
+        )
+        isbn, book_key = key(item, 'isbn'), key(item, 'book_id')
+        book_id = books_by_isbn.get(isbn) if isbn else (
+            int(book_key) if book_key and book_key.isdigit() and int(book_key) in books_by_id else None
+        )
+        if user_id is None:
+            results[index].update(ok=False, error='Unknown or inactive borrower.')
+        elif book_id is None:
+            results[index].update(ok=False, error='Unknown book.')
+        else:
+            resolved[index] = (user_id, book_id)
+    return resolved
+
+
+def _grouped_copies(book_counts, sign):
+    change = Case(
+        *[When(pk=book_id, then=F('available_copies') + sign * count) for book_id, count in book_counts.items()],
+        default=F('available_copies'),
+        output_field=IntegerField(),
+    )
+    return Least(change, F('total_copies')) if sign > 0 else change
+
+
+def _loans_changed(user_ids):
+    # Bulk writes skip the Transaction post_save receivers; drop the per-student caches they would have.
+    cache.delete_many([student_kpis_cache_key(user_id) for user_id in user_ids])
+    cache.delete_many([recommendation_cache_key(user_id) for user_id in user_ids])
+
+
+def issue_batch(items, due_date=None):
+    """
+    Issue a cart of ``{username|user_id, book_id|isbn}`` items in one transaction; returns per-item results.
+
+    Borrowers, books and open loans are checked in set-based queries, the
+    books' rows are locked once, loans are written with ``bulk_create`` and
+    copies taken with a single grouped UPDATE. A borrower collecting an
+    AVAILABLE hold takes the copy set aside for them instead. An item fails
+    alone (unknown borrower or book, already on loan, no copy left) without
+    affecting the rest.
+    """
+    due_date = due_date or timezone.localdate() + timedelta(days=LOAN_PERIOD_DAYS)
+    results = [{'index': index, 'ok': True} for index in range(len(items))]
+    resolved = _resolve_items(items, results, active_members_only=True)
+    if not resolved:
+        return results
+
+    with transaction.atomic():
+        pairs = resolved.values()
+        copies = dict(
+            Book.objects.select_for_update().filter(pk__in={book_id for _, book_id in pairs})
+            .order_by('pk').values_list('pk', 'available_copies')
+        )
+        on_loan = set(
+            Transaction.objects.filter(
+                returned_on__isnull=True,
+                user_id__in={user_id for user_id, _ in pairs},
+                book_id__in=copies,
+            ).values_list('user_id', 'book_id')
+        )
+        held = reservations.fulfil_holds(pair for pair in pairs if pair not in on_loan)
+        loans, taken = {}, Counter()
+        for index, (user_id, book_id) in resolved.items():
+            if (user_id, book_id) in on_loan:
+                results[index].update(ok=False, error='This book is already issued to the borrower.')
+            elif (user_id, book_id) in held:
+                # Collecting a hold: the copy was set aside when the reservation was promoted
+                held.discard((user_id, book_id))
+                on_loan.add((user_id, book_id))
+                loans[index] = Transaction(user_id=user_id, book_id=book_id, due_date=due_date)
+            elif copies[book_id] <= 0:
+                results[index].update(ok=False, error='No copies available.')
+            else:
+                copies[book_id] -= 1
+                taken[book_id] += 1
+                on_loan.add((user_id, book_id))
+                loans[index] = Transaction(user_id=user_id, book_id=book_id, due_date=due_date)
+        if not loans:
+            return results
+
+        Transaction.objects.bulk_create(loans.values())
+        if taken:
+            Book.objects.filter(pk__in=taken).update(available_copies=_grouped_copies(taken, -1))
+            _copies_changed({book_id: -count for book_id, count in taken.items()})
+        popularity.record_issues(Counter(loan.book_id for loan in loans.values()))
+        rollup.record_issues(loans.values())
+        record_borrows((loan.user_id, loan.book_id) for loan in loans.values())
+        _loans_changed({loan.user_id for loan in loans.values()})
+
+    for index, loan in loans.items():
+        results[index].update(transaction_id=loan.pk, due_date=loan.due_date.isoformat())
+    return results
+
+
+def return_batch(items, returned_on=None):
+    """
+    Return a cart of ``{username|user_id, book_id|isbn}`` items in one transaction; returns per-item results.
+
+    Each item closes the borrower's oldest open loan of that book. Fines are
+    set by one CASE UPDATE, and copies go first to waiting reservations
+    (reported as ``hold_for``) and the rest back to the shelf in one grouped
+    UPDATE.
+    """
+    returned_on = returned_on or timezone.localdate()
+    results = [{'index': index, 'ok': True} for index in range(len(items))]
+    resolved = _resolve_items(items, results)
+    if not resolved:
+        return results
+
+    with transaction.atomic():
+        pairs = resolved.values()
+        open_loans = {}
+        for loan in (
+            Transaction.objects.select_for_update().filter(
+                returned_on__isnull=True,
+                user_id__in={user_id for user_id, _ in pairs},
+                book_id__in={book_id for _, book_id in pairs},
+            ).order_by('-issued_on', '-pk')
+        ):
+            # Oldest loan last, so it wins for a borrower holding several copies
+            open_loans.setdefault((loan.user_id, loan.book_id), []).append(loan)
+
+        loans = {}
+        for index, pair in resolved.items():
+            if not open_loans.get(pair):
+                results[index].update(ok=False, error='No open loan of this book for the borrower.')
+                continue
+            loan = open_loans[pair].pop()
+            loan.returned_on = returned_on
+            loan.fine_amount = calculate_fine(loan.due_date, returned_on)
+            loan.status = 'RETURNED'
+            loans[index] = loan
+        if not loans:
+            return results
+
+        Transaction.objects.filter(pk__in=[loan.pk for loan in loans.values()]).update(
+            returned_on=returned_on,
+            status='RETURNED',
+            fine_amount=Case(
+                *[When(pk=loan.pk, then=loan.fine_amount) for loan in loans.values()],
+                default=F('fine_amount'),
+                output_field=DecimalField(max_digits=7, decimal_places=2),
+            ),
+        )
+        live_dashboard.overdues_returned(loans.values())
+        returned = Counter(loan.book_id for loan in loans.values())
+        promoted, shelved = reservations.promote_waiting(returned)
+        release_copies(shelved)
+        popularity.record_returns(returned)
+        rollup.record_returns(loans.values())
+        _loans_changed({loan.user_id for loan in loans.values()})
+
+    holds = {}
+    for username, title, book_id in promoted:
+        holds.setdefault(book_id, []).append((username, title))
+    for index, loan in loans.items():
+        results[index].update(transaction_id=loan.pk, fine=str(loan.fine_amount))
+        if holds.get(loan.book_id):
+            results[index]['hold_for'], results[index]['book_title'] = holds[loan.book_id].pop(0)
+    return results
+
+
+def sweep_expired_holds(now=None):
+    """
+    Expire AVAILABLE holds past their pickup window and pass each freed copy on.
+
+    Each copy goes to the book's next waiting reservation, or back to the
+    shelf when the queue is empty, in the same transaction. Returns
+    ``(expired, promoted)`` as ``(username, book title[, book id])`` tuples
+    for the notifications.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired, freed = reservations.expire_holds(now)
+        promoted, shelved = reservations.promote_waiting(freed, now)
+        release_copies(shelved)
+    return expired, promoted
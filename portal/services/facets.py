@@ -0,0 +1,100 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Count, Q, Value
+from django.db.models.functions import Cast
+from portal.models import Book
+
+# Facet name (also its filter parameter) -> Book column it groups on
+FACETS = {
+    'department': 'department__name',
+    'category': 'subject',
+    'language': 'language',
+    'book_type': 'book_type',
+    'publication_year': 'publication_year',
+}
+FILTER_PARAMS = ('title', 'author', 'availability') + tuple(FACETS)
+
+FACET_CACHE_TTL = getattr(settings, 'FACET_CACHE_TTL', 300)
+FACET_GENERATION_CACHE_KEY = 'facet_index_generation'
+
+
+def facet_generation():
+    return cache.get(FACET_GENERATION_CACHE_KEY, 0)
+
+
+def bump_facet_generation():
+    cache.add(FACET_GENERATION_CACHE_KEY, 0, None)
+    return cache.incr(FACET_GENERATION_CACHE_KEY)
+
+
+def book_filters(params, skip=None):
+    """Build the advanced-search filter from ``params``, leaving out facet ``skip``'s own filter."""
+    condition = Q()
+    if params.get('title'):
+        condition &= Q(title__icontains=params['title'])
+    if params.get('author'):
+        condition &= Q(author__icontains=params['author'])
+    if params.get('availability') == 'available':
+        condition &= Q(available_copies__gt=0)
+    elif params.get('availability') == 'issued':
+        condition &= Q(available_copies=0)
+    for facet, column in FACETS.items():
+        value = params.get(facet)
+        if not value or facet == skip:
+            continue
+        if facet == 'publication_year':
+            condition &= Q(publication_year=int(value)) if value.isdigit() else Q(pk__in=[])
+        else:
+            condition &= Q(**{f'{column}__iexact': value})
+    return condition
+
+
+def facet_counts(params):
+    """
+    Return ``{facet: [(value, hits)]}`` for the books matching ``params``.
+
+    Each facet is counted against every filter except its own, so the
+    options of an active facet still show what switching to them would
+    return. All facets come back from one UNION ALL of grouped counts,
+    cached per filter combination until the next Book write.
+    """
+    params = {name: params.get(name, '') for name in FILTER_PARAMS}
+    digest = hashlib.md5(urlencode(sorted(params.items())).encode()).hexdigest()
+    cache_key = f"book_facets_{facet_generation()}_{digest}"
+    facets = cache.get(cache_key)
+    if facets is None:
+        facets = _count_facets(params)
+        cache.set(cache_key, facets, FACET_CACHE_TTL)
+    return facets
+
+
+def _facet_branch(params, facet, column):
+    books = Book.objects.filter(book_filters(params, skip=facet)).exclude(**{f'{column}__isnull': True})
+    if facet != 'publication_year':
+        books = books.exclude(**{column: ''})
+    return (
+        books.annotate(value=Cast(column, CharField()))
+        .values('value')
+        .annotate(hits=Count('id'), facet=Value(facet, output_field=CharField()))
+        .order_by()
+    )
+
+
+def _count_facets(params):
+    branches = [_facet_branch(params, facet, column) for facet, column in FACETS.items()]
+    facets = {facet: [] for facet in FACETS}
+    for row in branches[0].union(*branches[1:], all=True):
+        facets[row['facet']].append((row['value'], row['hits']))
+
+    for facet, options in facets.items():
+        selected = params.get(facet)
+        if selected and not any(value.lower() == selected.lower() for value, _ in options):
+            options.append((selected, 0))
+        if facet == 'publication_year':
+            options.sort(key=lambda option: -int(option[0]) if option[0].isdigit() else 0)
+        else:
+            options.sort(key=lambda option: option[0].lower())
+    return facets
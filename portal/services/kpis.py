@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from portal.models import Book, BookRequest, Profile, Transaction
+
+KPI_CACHE_TTL = getattr(settings, 'KPI_CACHE_TTL', 60)
+LOW_STOCK_THRESHOLD = 2
+
+LIBRARY_KPIS_CACHE_KEY = 'library_kpis'
+
+
+def student_kpis_cache_key(user_id):
+    return f"student_kpis_{user_id}"
+
+
+def _money(expression):
+    return Coalesce(expression, Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def book_metrics():
+    return Book.objects.aggregate(
+        total_books=Count('id'),
+        total_copies=Coalesce(Sum('total_copies'), Value(0)),
+        available_books=Count('id', filter=Q(available_copies__gt=0)),
+        low_stock_count=Count('id', filter=Q(available_copies__lte=LOW_STOCK_THRESHOLD)),
+    )
+
+
+def transaction_metrics(user=None):
+    """Loan, overdue and fine figures over every transaction, or only ``user``'s."""
+    transactions = Transaction.objects.all() if user is None else Transaction.objects.filter(user=user)
+    open_loan = Q(returned_on__isnull=True)
+    overdue = open_loan & Q(due_date__lt=timezone.localdate())
+    return transactions.aggregate(
+        total_issues=Count('id'),
+        active_issues=Count('id', filter=open_loan),
+        overdue_count=Count('id', filter=overdue),
+        total_fines=_money(Sum('fine_amount', filter=Q(fine_amount__gt=0))),
+        total_fine_collected=_money(Sum('fine_amount', filter=Q(returned_on__isnull=False, fine_amount__gt=0))),
+        pending_fines=_money(Sum('fine_amount', filter=overdue)),
+    )
+
+
+def request_metrics():
+    return BookRequest.objects.aggregate(
+        requested_books=Count('id'),
+        pending_requests=Count('id', filter=Q(status='PENDING')),
+    )
+
+
+def profile_metrics():
+    student = Q(role='student')
+    return Profile.objects.aggregate(
+        students=Count('id', filter=student),
+        active_students=Count('id', filter=student & Q(is_active_member=True)),
+    )
+
+
+def library_kpis():
+    """
+    Catalog-wide metrics for the admin and librarian dashboards.
+
+    One conditional aggregate per table (four queries in all), cached for
+    ``KPI_CACHE_TTL`` seconds and shared by the HTML and JSON dashboards.
+    """
+    kpis = cache.get(LIBRARY_KPIS_CACHE_KEY)
+    if kpis is None:
+        kpis = {**book_metrics(), **transaction_metrics(), **request_metrics(), **profile_metrics()}
+        cache.set(LIBRARY_KPIS_CACHE_KEY, kpis, KPI_CACHE_TTL)
+    return kpis
+
+
+def student_kpis(user):
+    """Loan and fine metrics for one student, in one query, cached like ``library_kpis``."""
+    cache_key = student_kpis_cache_key(user.id)
+    kpis = cache.get(cache_key)
+    if kpis is None:
+        kpis = transaction_metrics(user)
+        cache.set(cache_key, kpis, KPI_CACHE_TTL)
+    return kpis
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from portal.models import Book, BookRequest, Notification, Transaction
+from portal.services.kpis import LOW_STOCK_THRESHOLD
+from portal.services.notifications import enqueue
+
+LIBRARIANS_GROUP = 'librarians'
+
+
+def publish(delta, **payload):
+    """
+    Queue one dashboard delta for every staff socket in the ``librarians`` group.
+
+    The delta is computed once, here, and written to the notification
+    outbox in the caller's transaction; the dispatcher fans it out, so open
+    dashboards update without re-querying anything themselves.
+    """
+    return enqueue([Notification(
+        group=LIBRARIANS_GROUP, kind='DASHBOARD', title=delta, message='', payload={'delta': delta, **payload},
+    )])[0]
+
+
+def stock_changed(book_changes):
+    """
+    Publish the low-stock rows touched by ``book_changes`` (book id -> signed change in available copies).
+
+    Only books that are low on stock now, or were before copies came back,
+    are sent; the dashboard adds, updates or drops each row by its
+    ``available_copies``. Checkouts of well-stocked books publish nothing.
+    """
+    if not book_changes:
+        return None
+    books = [
+        {
+            'id': book['pk'],
+            'title': book['title'],
+            'available_copies': book['available_copies'],
+            'total_copies': book['total_copies'],
+            'department': book['department__name'],
+        }
+        for book in Book.objects.filter(pk__in=book_changes).values(
+            'pk', 'title', 'available_copies', 'total_copies', 'department__name',
+        )
+        if book['available_copies'] - max(book_changes[book['pk']], 0) <= LOW_STOCK_THRESHOLD
+    ]
+    if not books:
+        return None
+    return publish('stock', threshold=LOW_STOCK_THRESHOLD, books=books)
+
+
+def requests_changed(book_request=None):
+    """Publish the pending request count, with ``book_request`` when it is a new one."""
+    payload = {'pending_requests': BookRequest.objects.filter(status='PENDING').count()}
+    if book_request is not None:
+        payload['request'] = {
+            'id': book_request.pk,
+            'username': book_request.user.username,
+            'title': book_request.book.title,
+        }
+    return publish('requests', **payload)
+
+
+def _overdue_count(today):
+    return Transaction.objects.filter(returned_on__isnull=True, due_date__lt=today).count()
+
+
+def announce_new_overdues(today=None):
+    """Publish the loans that fell overdue today (due yesterday, still out) and the overdue total."""
+    today = today or timezone.localdate()
+    new_overdue = Transaction.objects.filter(returned_on__isnull=True, due_date=today - timedelta(days=1)).count()
+    if not new_overdue:
+        return None
+    return publish('overdue', new_overdue=new_overdue, overdue_count=_overdue_count(today))
+
+
+def overdues_returned(loans, today=None):
+    """Publish the overdue total when any of the just-closed ``loans`` was past due; call after closing them."""
+    today = today or timezone.localdate()
+    returned_overdue = sum(1 for loan in loans if loan.due_date < today)
+    if not returned_overdue:
+        return None
+    return publish('overdue', returned_overdue=returned_overdue, overdue_count=_overdue_count(today))
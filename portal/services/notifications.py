@@ -0,0 +1,235 @@
+import logging
+from datetime import timedelta
+from html import unescape
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.html import strip_tags
+from portal.models import Notification
+from portal.services.reminders import LIBRARY_FROM_EMAIL
+
+logger = logging.getLogger(__name__)
+
+# Outbox rows claimed and delivered per dispatcher pass
+NOTIFICATION_BATCH_SIZE = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 200)
+# Deliveries tried before a row is given up on as FAILED
+NOTIFICATION_MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+# Delay before the first retry, doubled on each one after
+NOTIFICATION_RETRY_SECONDS = getattr(settings, 'NOTIFICATION_RETRY_SECONDS', 30)
+# Most missed notifications a reconnecting socket is sent; older ones stay in the inbox
+NOTIFICATION_REPLAY_LIMIT = getattr(settings, 'NOTIFICATION_REPLAY_LIMIT', 50)
+
+
+def user_notification(user_id, username, title, message, type_status='info', email=False):
+    """An unsaved outbox row for one student's ``NotificationConsumer`` group; ``message`` is rendered as HTML."""
+    return Notification(
+        user_id=user_id, group=f"user_{username}", title=title, message=message,
+        type_status=type_status, email=email,
+    )
+
+
+def _assign_sequences(notifications):
+    """
+    Number each user's new notifications after the last one they have.
+
+    The users' rows are locked first and stay locked until the enclosing
+    transaction commits, so a concurrent writer for the same user waits and
+    then numbers after these rows: ``seq`` follows commit order, which the
+    auto-increment ``id`` does not, and a client's ``last_seen`` never
+    skips a row that commits late.
+    """
+    user_ids = sorted({notification.user_id for notification in notifications if notification.user_id})
+    if not user_ids:
+        return
+    list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    last = dict(
+        Notification.objects.filter(user_id__in=user_ids).values('user_id').annotate(last=Max('seq'))
+        .values_list('user_id', 'last')
+    )
+    for notification in notifications:
+        if notification.user_id:
+            last[notification.user_id] = notification.seq = (last.get(notification.user_id) or 0) + 1
+
+
+def enqueue(notifications):
+    """
+    Write ``notifications`` to the outbox in one INSERT and return them.
+
+    Call this inside the transaction making the change being announced:
+    the rows commit or roll back with it, and nothing touches the channel
+    layer or the mail server until the dispatcher picks them up.
+    """
+    notifications = list(notifications)
+    with transaction.atomic():
+        _assign_sequences(notifications)
+        return Notification.objects.bulk_create(notifications)
+
+
+def notify(user, title, message, type_status='info', email=False):
+    """Queue one notification for ``user``; see ``enqueue``."""
+    return enqueue([user_notification(user.pk, user.username, title, message, type_status, email)])[0]
+
+
+def channel_event(notification):
+    if notification.kind == 'DASHBOARD':
+        return {'type': 'dashboard.delta', 'id': notification.pk, 'delta': notification.payload}
+    return {
+        'type': 'notification.message',
+        'id': notification.pk,
+        'seq': notification.seq,
+        'title': notification.title,
+        'message': notification.message,
+        'type_status': notification.type_status,
+    }
+
+
+def inbox_item(notification):
+    """The JSON shape of an inbox entry, as sent to the browser."""
+    return {
+        'id': notification.pk,
+        'seq': notification.seq,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.type_status,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def inbox(user_id):
+    return Notification.objects.filter(user_id=user_id)
+
+
+def missed_notifications(user_id, last_seen, limit=None):
+    """
+    The user's notifications after sequence number ``last_seen``, oldest first, at most ``limit`` of the newest.
+
+    One range scan on the ``(user, seq)`` unique index; made once per
+    socket connect, so live delivery needs no polling.
+    """
+    rows = list(inbox(user_id).filter(seq__gt=last_seen).order_by('-seq')[:limit or NOTIFICATION_REPLAY_LIMIT])
+    rows.reverse()
+    return rows
+
+
+def latest_sequence(user_id):
+    return inbox(user_id).aggregate(last=Max('seq'))['last'] or 0
+
+
+async def _push_all(channel_layer, notifications):
+    failures = {}
+    for notification in notifications:
+        try:
+            await channel_layer.group_send(notification.group, channel_event(notification))
+        except Exception as exc:
+            failures[notification.pk] = f"push: {exc}"
+    return failures
+
+
+def push(notifications):
+    """
+    Send ``notifications`` to the channel layer in one ``async_to_sync`` call; returns ``{id: error}`` for failures.
+
+    One event loop hand-off covers the batch, and a failing group does not
+    stop the rest.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not notifications:
+        return {}
+    return async_to_sync(_push_all)(channel_layer, notifications)
+
+
+def send_emails(notifications):
+    """Email ``notifications`` over one connection; returns ``{id: error}`` when the batch could not be sent."""
+    messages = [
+        EmailMessage(
+            notification.title, unescape(strip_tags(notification.message)), LIBRARY_FROM_EMAIL,
+            [notification.user.email],
+        )
+        for notification in notifications
+    ]
+    if not messages:
+        return {}
+    try:
+        with get_connection() as connection:
+            connection.send_messages(messages)
+    except Exception as exc:
+        return {notification.pk: f"email: {exc}" for notification in notifications}
+    return {}
+
+
+def dispatch_pending(batch_size=None, now=None):
+    """
+    Claim one batch of due outbox rows, deliver them and record the outcome; returns the rows handled.
+
+    Rows are claimed oldest first with ``SKIP LOCKED``, so dispatchers
+    running side by side never deliver the same row twice. The WebSocket
+    push and the email are tracked separately and a retry repeats only the
+    half that failed, after an exponential backoff, until
+    ``NOTIFICATION_MAX_ATTEMPTS`` marks the row FAILED. Delivered
+    dashboard deltas are deleted rather than kept: they belong to no
+    user's inbox, and the rows would otherwise pile up forever.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        batch = list(
+            Notification.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user')
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .order_by('pk')[:batch_size or NOTIFICATION_BATCH_SIZE]
+        )
+        if not batch:
+            return 0
+        to_push = [notification for notification in batch if notification.pushed_at is None]
+        to_email = [
+            notification for notification in batch
+            if notification.email and notification.emailed_at is None and notification.user and notification.user.email
+        ]
+        failures = push(to_push)
+        for notification in to_push:
+            if notification.pk not in failures:
+                notification.pushed_at = now
+        email_failures = send_emails(to_email)
+        for notification in to_email:
+            if notification.pk not in email_failures:
+                notification.emailed_at = now
+
+        delivered_deltas = set()
+        for notification in batch:
+            errors = [error for error in (failures.get(notification.pk), email_failures.get(notification.pk)) if error]
+            if not errors:
+                if notification.kind == 'DASHBOARD':
+                    delivered_deltas.add(notification.pk)
+                notification.status = 'SENT'
+                continue
+            notification.attempts += 1
+            notification.last_error = "; ".join(errors)
+            if notification.attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = 'FAILED'
+                logger.warning("Giving up on notification %s: %s", notification.pk, notification.last_error)
+            else:
+                notification.next_attempt_at = now + timedelta(
+                    seconds=NOTIFICATION_RETRY_SECONDS * 2 ** (notification.attempts - 1)
+                )
+        Notification.objects.filter(pk__in=delivered_deltas).delete()
+        Notification.objects.bulk_update(
+            [notification for notification in batch if notification.pk not in delivered_deltas],
+            ['status', 'attempts', 'next_attempt_at', 'pushed_at', 'emailed_at', 'last_error'],
+        )
+    return len(batch)
+
+
+def drain_outbox(max_batches=50, batch_size=None):
+    """Dispatch batches until the outbox has nothing due or ``max_batches`` have gone; returns the rows handled."""
+    handled = 0
+    for _ in range(max_batches):
+        count = dispatch_pending(batch_size)
+        handled += count
+        if count < (batch_size or NOTIFICATION_BATCH_SIZE):
+            break
+    return handled
@@ -0,0 +1,187 @@
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+APPROXIMATE_COUNT_TTL = getattr(settings, 'APPROXIMATE_COUNT_TTL', 60)
+
+
+def encode_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by ``encode_cursor``; malformed input yields ``None``."""
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+
+
+def approximate_count(queryset):
+    """
+    Estimate ``queryset.count()`` without scanning every matching row.
+
+    PostgreSQL answers from the planner's row estimate. Other databases
+    count exactly, but the result is reused for ``APPROXIMATE_COUNT_TTL``
+    seconds across requests.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    sql, params = queryset.order_by().query.sql_with_params()
+    cache_key = 'approx_count_' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, APPROXIMATE_COUNT_TTL)
+    return count
+
+
+class CursorPage:
+    """One page of a cursor-paginated listing; iterates over its objects."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_is_approximate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_approximate = count_is_approximate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_list(items, cursor=None, per_page=12, hydrate=None):
+    """
+    Page through an in-memory sequence (e.g. a cached search ranking) with offset cursors.
+
+    ``hydrate`` turns the sliced items into the objects to display.
+    """
+    state = decode_cursor(cursor)
+    offset = state.get('o') if isinstance(state, dict) else None
+    if not isinstance(offset, int) or offset < 0:
+        offset = 0
+    end = offset + per_page
+    window = items[offset:end]
+    return CursorPage(
+        hydrate(window) if hydrate else list(window),
+        next_cursor=encode_cursor({'o': end}) if end < len(items) else None,
+        previous_cursor=encode_cursor({'o': max(offset - per_page, 0)}) if offset else None,
+        count=len(items),
+    )
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over a queryset.
+
+    Instead of ``OFFSET`` each page filters on the ordering key of the row
+    it continues from, so with an index on that key every page costs the
+    same, however deep. ``ordering`` must end in a unique field (the primary
+    key) so that rows with equal leading values are never skipped.
+    ``count`` is ``None`` (no total), ``'exact'`` or ``'approximate'``.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.count_mode = count
+
+    @cached_property
+    def count(self):
+        if self.count_mode == 'exact':
+            return self.queryset.count()
+        if self.count_mode == 'approximate':
+            return approximate_count(self.queryset)
+        return None
+
+    def _ordering(self, forward):
+        return [f"{'-' if desc == forward else ''}{name}" for name, desc in self.keys]
+
+    def _after(self, values, forward):
+        """Rows strictly after ``values`` in the direction of travel."""
+        condition = Q()
+        for i, (name, desc) in enumerate(self.keys):
+            lookup = 'lt' if desc == forward else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for (prev_name, _), prev_value in zip(self.keys[:i], values):
+                step &= Q(**{prev_name: prev_value})
+            condition |= step
+        return condition
+
+    def _key_values(self, obj):
+        values = []
+        for name, _ in self.keys:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if isinstance(value, (date, datetime)) else value)
+        return values
+
+    def _parse_values(self, raw):
+        model = self.queryset.model
+        if not isinstance(raw, list) or len(raw) != len(self.keys):
+            raise ValueError('cursor does not match the ordering')
+        return [model._meta.get_field(name).to_python(value) for (name, _), value in zip(self.keys, raw)]
+
+    def _cursor(self, obj, direction):
+        return encode_cursor({'d': direction, 'v': self._key_values(obj)})
+
+    def get_page(self, cursor=None):
+        """Return the page after (or, for a "previous" cursor, before) ``cursor``; the first page on a bad cursor."""
+        state = decode_cursor(cursor)
+        try:
+            values = self._parse_values(state['v']) if state else None
+        except (KeyError, TypeError, ValueError, ValidationError):
+            values = None
+        if values is None:
+            return self._page(None, forward=True)
+        return self._page(values, forward=state.get('d') != 'p')
+
+    def _page(self, values, forward):
+        rows = self.queryset.order_by(*self._ordering(forward))
+        if values is not None:
+            rows = rows.filter(self._after(values, forward))
+        rows = list(rows[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            next_cursor = self._cursor(rows[-1], 'n') if more else None
+            previous_cursor = self._cursor(rows[0], 'p') if rows and values is not None else None
+            return self._make_page(rows, next_cursor, previous_cursor)
+
+        if not more:
+            # Walked back to the start: serve a full first page instead of a short one.
+            return self._page(None, forward=True)
+        rows.reverse()
+        return self._make_page(rows, self._cursor(rows[-1], 'n'), self._cursor(rows[0], 'p'))
+
+    def _make_page(self, rows, next_cursor, previous_cursor):
+        return CursorPage(rows, next_cursor, previous_cursor, self.count, self.count_mode == 'approximate')
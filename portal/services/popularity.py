@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from portal.models import Book, BookPopularity, Transaction
+
+POPULARITY_FIELDS = ['issue_count', 'issues_30d', 'issues_90d', 'active_loans', 'reconciled_at']
+
+
+def record_issue(book_id):
+    """Count a new loan of ``book_id`` in every popularity window."""
+    with transaction.atomic():
+        BookPopularity.objects.get_or_create(book_id=book_id)
+        BookPopularity.objects.filter(book_id=book_id).update(
+            issue_count=F('issue_count') + 1,
+            issues_30d=F('issues_30d') + 1,
+            issues_90d=F('issues_90d') + 1,
+            active_loans=F('active_loans') + 1,
+        )
+
+
+def record_return(book_id):
+    """Release one active loan of ``book_id``."""
+    BookPopularity.objects.filter(book_id=book_id, active_loans__gt=0).update(
+        active_loans=F('active_loans') - 1,
+    )
+
+
+def _grouped(field, book_counts, sign=1):
+    return Case(
+        *[When(book_id=book_id, then=F(field) + sign * count) for book_id, count in book_counts.items()],
+        default=F(field),
+        output_field=IntegerField(),
+    )
+
+
+def record_issues(book_counts):
+    """Bulk ``record_issue``: ``book_counts`` maps book id -> new loans, applied in one grouped UPDATE."""
+    if not book_counts:
+        return
+    with transaction.atomic():
+        BookPopularity.objects.bulk_create(
+            [BookPopularity(book_id=book_id) for book_id in book_counts], ignore_conflicts=True,
+        )
+        BookPopularity.objects.filter(book_id__in=book_counts).update(**{
+            field: _grouped(field, book_counts)
+            for field in ('issue_count', 'issues_30d', 'issues_90d', 'active_loans')
+        })
+
+
+def record_returns(book_counts):
+    """Bulk ``record_return``: ``book_counts`` maps book id -> returned loans."""
+    if not book_counts:
+        return
+    BookPopularity.objects.filter(book_id__in=book_counts).update(
+        active_loans=Greatest(_grouped('active_loans', book_counts, sign=-1), Value(0)),
+    )
+
+
+def reconcile_popularity(batch_size=1000):
+    """
+    Recompute every counter from the transaction history in one grouped query.
+
+    The rolling 30/90-day windows only grow between runs, so this is also
+    what ages old issues out of them. Returns the number of books reconciled.
+    """
+    now = timezone.now()
+    stats = {
+        row.pop('book_id'): row
+        for row in (
+            Transaction.objects.values('book_id')
+            .annotate(
+                issue_count=Count('id'),
+                issues_30d=Count('id', filter=Q(issued_on__gte=now - timedelta(days=30))),
+                issues_90d=Count('id', filter=Q(issued_on__gte=now - timedelta(days=90))),
+                active_loans=Count('id', filter=Q(returned_on__isnull=True)),
+            )
+            .order_by()
+        )
+    }
+    empty = {'issue_count': 0, 'issues_30d': 0, 'issues_90d': 0, 'active_loans': 0}
+    objs = [
+        BookPopularity(book_id=book_id, reconciled_at=now, **stats.get(book_id, empty))
+        for book_id in Book.objects.values_list('id', flat=True).iterator()
+    ]
+    BookPopularity.objects.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['book'],
+        update_fields=POPULARITY_FIELDS,
+    )
+    return len(objs)
+
+
+def with_popularity(queryset=None):
+    """Annotate books with their lifetime ``issue_count`` and order by it, most issued first."""
+    if queryset is None:
+        queryset = Book.objects.all()
+    return queryset.annotate(
+        issue_count=Coalesce(F('popularity__issue_count'), Value(0)),
+    ).order_by('-issue_count', 'id')
+
+
+def popular_book_counts(limit, exclude_ids=(), department=None):
+    """Return ``[(book_id, issue_count)]`` for the most issued books, read off the counter index."""
+    rows = BookPopularity.objects.filter(issue_count__gt=0).exclude(book_id__in=exclude_ids)
+    if department is not None:
+        rows = rows.filter(book__department=department)
+    return list(rows.order_by('-issue_count', 'book_id').values_list('book_id', 'issue_count')[:limit])
+
+
+def most_issued(limit=10):
+    """Return ``[{'book__title', 'total_issues'}]`` for the most issued books."""
+    return list(
+        BookPopularity.objects.filter(issue_count__gt=0)
+        .order_by('-issue_count', 'book_id')
+        .values('book__title', total_issues=F('issue_count'))[:limit]
+    )
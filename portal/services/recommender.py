@@ -1,70 +1,156 @@
-from django.db.models import Count
+from django.conf import settings
+from django.db.models import Case, Value, When
 from django.core.cache import cache
-from portal.models import Transaction, Book, Profile
+from django.utils import timezone
+from portal.models import Transaction, Book, Profile, RecommendationSnapshot
+from portal.services.similarity import similar_book_scores
+from portal.services.popularity import popular_book_counts, with_popularity
 
-def get_recommendations(user, limit=10):
-    cache_key = f"recommendations_{user.id}"
-    recommendations = cache.get(cache_key)
-    if recommendations is not None:
-        return recommendations
+SNAPSHOT_SIZE = getattr(settings, 'RECOMMENDATION_SNAPSHOT_SIZE', 20)
+CACHE_TTL = getattr(settings, 'RECOMMENDATION_CACHE_TTL', 3600)
+
+
+def recommendation_cache_key(user_id):
+    return f"recommendations_{user_id}"
+
+
+def is_student(user):
+    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'student'
+
+
+def score_recommendations(user, limit=10):
     """
-    Get personalized book recommendations using layered approach:
+    Live-score personalized recommendations and return ranked ``(book_id, score)`` pairs.
+
+    Layered approach:
     - Content-based: Similar department, subject, category
     - Collaborative: Books borrowed by similar users
     - Popularity: Globally popular books
     """
-    if not user.is_authenticated or not hasattr(user, 'profile') or user.profile.role != 'student':
-        # For non-students or unauthenticated, return popular books
-        popular_books = Book.objects.annotate(issue_count=Count('transaction')).order_by('-issue_count')[:limit]
-        return popular_books
-
-    borrowed_ids = set(Transaction.objects.filter(user=user).values_list('book_id', flat=True))
+    borrowed = Transaction.objects.filter(user=user).values_list('book_id', 'book__subject', 'book__category_id')
+    borrowed_ids, borrowed_subjects, borrowed_categories = set(), set(), set()
+    for book_id, subject, category_id in borrowed:
+        borrowed_ids.add(book_id)
+        borrowed_subjects.add(subject)
+        if category_id is not None:
+            borrowed_categories.add(category_id)
 
     scores = {}
 
-    # Layer 1: Content-based filtering
+    # Layer 1: Content-based filtering, scored for the whole department in one query
     dept = user.profile.department
     if dept:
-        content_books = Book.objects.filter(department=dept).exclude(id__in=borrowed_ids)
-        for book in content_books:
-            score = 1  # Department match
-            # Check if user borrowed books with same subject
-            if Transaction.objects.filter(user=user, book__subject=book.subject).exists():
-                score += 3  # Subject similarity
-            # Check category similarity (assuming category FK)
-            if book.category and Transaction.objects.filter(user=user, book__category=book.category).exists():
-                score += 2  # Category similarity
-            scores[book.id] = scores.get(book.id, 0) + score * 0.5  # Weighted
-
-    # Layer 2: Collaborative filtering (lightweight co-occurrence)
-    common_users = Transaction.objects.filter(book__in=borrowed_ids).exclude(user=user).values_list('user_id', flat=True).distinct()
-    if common_users:
-        collab_data = Transaction.objects.filter(user__in=common_users).exclude(book_id__in=borrowed_ids).values('book_id').annotate(c=Count('book_id')).order_by('-c')
-        for item in collab_data:
-            book_id = item['book_id']
-            if book_id not in borrowed_ids:
-                scores[book_id] = scores.get(book_id, 0) + item['c'] * 0.3  # Weighted co-occurrence
+        content_books = (
+            Book.objects.filter(department=dept)
+            .exclude(id__in=borrowed_ids)
+            .annotate(content_score=(
+                Value(1)  # Department match
+                + Case(When(subject__in=borrowed_subjects, then=Value(3)), default=Value(0))  # Subject similarity
+                + Case(When(category_id__in=borrowed_categories, then=Value(2)), default=Value(0))  # Category similarity
+            ))
+            .values_list('id', 'content_score')
+        )
+        for book_id, score in content_books:
+            scores[book_id] = scores.get(book_id, 0) + score * 0.5  # Weighted
+
+    # Layer 2: Collaborative filtering (precomputed co-borrow neighbours)
+    for book_id, co_borrows in similar_book_scores(borrowed_ids, exclude_ids=borrowed_ids).items():
+        scores[book_id] = scores.get(book_id, 0) + co_borrows * 0.3  # Weighted co-occurrence
 
     # Layer 3: Popularity bias
-    popular_books = Book.objects.exclude(id__in=borrowed_ids).annotate(issue_count=Count('transaction')).order_by('-issue_count')[:20]
-    for book in popular_books:
-        scores[book.id] = scores.get(book.id, 0) + book.issue_count * 0.2 / 10  # Normalized weight
+    for book_id, issue_count in popular_book_counts(20, exclude_ids=borrowed_ids):
+        scores[book_id] = scores.get(book_id, 0) + issue_count * 0.2 / 10  # Normalized weight
 
     # Layer 4: Department Popularity
     if dept:
-        dept_popular_books = Book.objects.filter(department=dept).exclude(id__in=borrowed_ids).annotate(issue_count=Count('transaction')).order_by('-issue_count')[:10]
-        for book in dept_popular_books:
-            scores[book.id] = scores.get(book.id, 0) + book.issue_count * 0.1  # Weighted for department popularity
+        for book_id, issue_count in popular_book_counts(10, exclude_ids=borrowed_ids, department=dept):
+            scores[book_id] = scores.get(book_id, 0) + issue_count * 0.1  # Weighted for department popularity
 
-    # Rank and return top books
+    # Rank top books
     if scores:
-        ranked_ids = sorted(scores, key=scores.get, reverse=True)[:limit]
-        recommendations = Book.objects.filter(id__in=ranked_ids).select_related('department', 'category')
-    else:
-        # Fallback: Department popular or global popular
-        if dept:
-            recommendations = Book.objects.filter(department=dept).annotate(issue_count=Count('transaction')).order_by('-issue_count')[:limit]
-        else:
-            recommendations = Book.objects.annotate(issue_count=Count('transaction')).order_by('-issue_count')[:limit]
-
-    return recommendations
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    # Fallback: Department popular or global popular
+    books = Book.objects.filter(department=dept) if dept else None
+    return popular_ranking(books, limit)
+
+
+def popular_ranking(books=None, limit=10):
+    """Rank ``books`` (default: the whole catalog) by lifetime issues as ``(book_id, issue_count)`` pairs."""
+    return list(with_popularity(books).values_list('id', 'issue_count')[:limit])
+
+
+def hydrate(ranking):
+    """Load the books of a ranking in one query, keeping rank order and attaching ``recommendation_score``."""
+    books = Book.objects.select_related('department', 'category').in_bulk([book_id for book_id, _ in ranking])
+    ranked = []
+    for book_id, score in ranking:
+        book = books.get(book_id)
+        if book is not None:
+            book.recommendation_score = score
+            ranked.append(book)
+    return ranked
+
+
+def get_recommendations(user, limit=10):
+    """
+    Return recommended books for ``user`` as a rank-ordered list.
+
+    The ranking is cached as ``(book_id, score)`` pairs, so a warm request
+    costs only the single hydration query. On a miss, students read the list
+    precomputed by the batch job, less any book they borrowed since, and only
+    fall back to live scoring when they have no snapshot yet (e.g. new
+    accounts).
+    """
+    cache_key = recommendation_cache_key(user.id if user.is_authenticated else 'anonymous')
+    ranking = cache.get(cache_key)
+    if ranking is None:
+        ranking = rank_recommendations(user)
+        cache.set(cache_key, ranking, CACHE_TTL)
+    return hydrate(ranking[:limit])
+
+
+def rank_recommendations(user, size=SNAPSHOT_SIZE):
+    if not is_student(user):
+        # For non-students or unauthenticated, return popular books
+        return popular_ranking(limit=size)
+
+    snapshot = (
+        RecommendationSnapshot.objects.filter(user=user)
+        .values_list('book_ids', 'scores', 'computed_at')
+        .first()
+    )
+    if snapshot is not None:
+        book_ids, scores, computed_at = snapshot
+        # Loans opened since the batch run would otherwise be recommended back to the borrower
+        borrowed_since = set(
+            Transaction.objects.filter(user=user, issued_on__gte=computed_at).values_list('book_id', flat=True)
+        )
+        return [
+            (book_id, score) for book_id, score in zip(book_ids, scores or [None] * len(book_ids))
+            if book_id not in borrowed_since
+        ]
+    return score_recommendations(user, size)
+
+
+def precompute_recommendations(user_ids, size=SNAPSHOT_SIZE):
+    """Score and store recommendation snapshots for the given students. Returns the count stored."""
+    now = timezone.now()
+    students = Profile.objects.filter(user_id__in=user_ids, role='student').select_related('user', 'department')
+    snapshots = []
+    for profile in students:
+        ranking = score_recommendations(profile.user, limit=size)
+        snapshots.append(RecommendationSnapshot(
+            user_id=profile.user_id,
+            book_ids=[book_id for book_id, _ in ranking],
+            scores=[score for _, score in ranking],
+            computed_at=now,
+        ))
+    RecommendationSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['book_ids', 'scores', 'computed_at'],
+    )
+    cache.delete_many([recommendation_cache_key(snapshot.user_id) for snapshot in snapshots])
+    return len(snapshots)
@@ -0,0 +1,213 @@
+import logging
+import time
+from datetime import timedelta
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from portal.models import ReminderLog, Transaction
+from portal.utils import calculate_fine
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_FROM_EMAIL = 'library@anu.ac.in'
+LIBRARY_SIGNATURE = "— Acharya Nagarjuna University Library"
+# Messages handed to one ``send_messages`` call on the shared connection
+REMINDER_BATCH_SIZE = getattr(settings, 'REMINDER_BATCH_SIZE', 200)
+# Students per Celery subtask when the overdue run is fanned out
+REMINDER_CHUNK_SIZE = getattr(settings, 'REMINDER_CHUNK_SIZE', 1000)
+# Days of reminder ledger kept before pruning
+REMINDER_LOG_RETENTION_DAYS = getattr(settings, 'REMINDER_LOG_RETENTION_DAYS', 30)
+
+
+def not_yet_reminded(loans, kind, today):
+    """``loans`` without a ``kind`` reminder logged for ``today``: one anti-join against the ledger."""
+    already_sent = ReminderLog.objects.filter(transaction=OuterRef('pk'), kind=kind, sent_on=today)
+    return loans.filter(~Exists(already_sent))
+
+
+def record_reminders(transaction_ids, kind, today):
+    """Log ``kind`` reminders as sent today; rows a concurrent or earlier run wrote are left alone."""
+    ReminderLog.objects.bulk_create(
+        [ReminderLog(transaction_id=tx_id, kind=kind, sent_on=today) for tx_id in transaction_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def prune_reminder_log(today=None, keep_days=None):
+    today = today or timezone.localdate()
+    cutoff = today - timedelta(days=keep_days or REMINDER_LOG_RETENTION_DAYS)
+    return ReminderLog.objects.filter(sent_on__lt=cutoff).delete()[0]
+
+
+def overdue_loans(today=None):
+    """Open loans past their due date, with a borrower email, not yet reminded about today."""
+    today = today or timezone.localdate()
+    loans = Transaction.objects.filter(returned_on__isnull=True, due_date__lt=today).exclude(user__email='')
+    return not_yet_reminded(loans, 'OVERDUE', today)
+
+
+def overdue_user_ids(today=None):
+    return list(overdue_loans(today).order_by('user_id').values_list('user_id', flat=True).distinct())
+
+
+def chunked(items, size):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+# Days before the due date -> ledger kind of the reminder sent then
+DUE_REMINDER_KINDS = {3: 'DUE_3', 1: 'DUE_1'}
+
+
+def render_due_reminder(username, email, title, due_date, days_left):
+    if days_left == 1:
+        subject = f"URGENT: '{title}' is due tomorrow"
+        body = f"Dear {username},\n\nPlease return '{title}' tomorrow ({due_date}) to avoid fines."
+    else:
+        subject = f"Library Reminder: '{title}' is due in {days_left} days"
+        body = f"Dear {username},\n\nPlease return '{title}' on or before {due_date}."
+    return EmailMessage(subject, body, LIBRARY_FROM_EMAIL, [email])
+
+
+def send_due_date_reminders(today=None):
+    """
+    Remind borrowers of loans due in 3 days or tomorrow; returns ``{days_left: sent}``.
+
+    Both buckets come from one ``due_date IN (...)`` query, streamed with
+    ``.iterator()`` and sent over one connection. Loans with a due-date
+    reminder already logged today are skipped, and only batches the mail
+    backend accepted are counted and logged.
+    """
+    today = today or timezone.localdate()
+    due_dates = {today + timedelta(days=days): days for days in DUE_REMINDER_KINDS}
+    already_sent = ReminderLog.objects.filter(
+        transaction=OuterRef('pk'), kind__in=DUE_REMINDER_KINDS.values(), sent_on=today,
+    )
+    rows = (
+        Transaction.objects.filter(status='ISSUED', returned_on__isnull=True, due_date__in=due_dates)
+        .exclude(user__email='')
+        .filter(~Exists(already_sent))
+        .values_list('id', 'user__username', 'user__email', 'book__title', 'due_date')
+        .iterator(chunk_size=2000)
+    )
+    counts = dict.fromkeys(DUE_REMINDER_KINDS, 0)
+
+    def messages():
+        for tx_id, username, email, title, due_date in rows:
+            days_left = due_dates[due_date]
+            yield render_due_reminder(username, email, title, due_date, days_left), (tx_id, days_left)
+
+    def log_batch(tags):
+        for days_left, kind in DUE_REMINDER_KINDS.items():
+            delivered = [tx_id for tx_id, days in tags if days == days_left]
+            counts[days_left] += len(delivered)
+            record_reminders(delivered, kind, today)
+
+    send_in_batches(messages(), after_batch=log_batch)
+    return counts
+
+
+def render_overdue_digest(username, email, loans, today):
+    """One reminder covering every overdue ``(title, due_date)`` in ``loans``."""
+    lines, total_fine = [], 0
+    for title, due_date in loans:
+        fine = calculate_fine(due_date, today)
+        total_fine += fine
+        lines.append(
+            f"  - '{title}': due on {due_date}, {(today - due_date).days} days overdue, estimated fine ₹{fine}"
+        )
+    if len(loans) == 1:
+        subject = f"Overdue Book Reminder – '{loans[0][0]}'"
+    else:
+        subject = f"Overdue Book Reminder – {len(loans)} books"
+    body = (
+        f"Dear {username},\n\n"
+        f"The following books issued to you are overdue as of {today}:\n\n"
+        + "\n".join(lines)
+        + f"\n\nTotal estimated fine: ₹{total_fine}\n\n"
+        "Please return the books as soon as possible.\n\n"
+        f"{LIBRARY_SIGNATURE}"
+    )
+    return EmailMessage(subject, body, LIBRARY_FROM_EMAIL, [email])
+
+
+def overdue_digests(user_ids, today):
+    """Yield ``(message, loan_ids)`` per student in ``user_ids``, streamed from one ordered query."""
+    rows = (
+        overdue_loans(today)
+        .filter(user_id__in=user_ids)
+        .order_by('user_id', 'due_date', 'id')
+        .values_list('user_id', 'user__username', 'user__email', 'id', 'book__title', 'due_date')
+        .iterator(chunk_size=2000)
+    )
+    for (_, username, email), loans in groupby(rows, key=lambda row: row[:3]):
+        loans = [row[3:] for row in loans]
+        message = render_overdue_digest(username, email, [(title, due_date) for _, title, due_date in loans], today)
+        yield message, [tx_id for tx_id, _, _ in loans]
+
+
+def send_in_batches(messages, batch_size=None, after_batch=None):
+    """
+    Send ``(message, tag)`` pairs over a single mail connection, ``batch_size`` at a time.
+
+    ``after_batch`` gets the tags of each batch only once the backend has
+    accepted it. A batch that raises or sends nothing is logged and skipped,
+    so it is not recorded in the reminder ledger and the next run retries
+    it. Returns the number sent.
+    """
+    batch_size = batch_size or REMINDER_BATCH_SIZE
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for batch in chunked(messages, batch_size):
+            try:
+                count = connection.send_messages([message for message, _ in batch]) or 0
+            except Exception:
+                logger.exception("Could not send a batch of %d reminder emails", len(batch))
+                continue
+            if not count:
+                logger.warning("Mail backend accepted none of a batch of %d reminder emails", len(batch))
+                continue
+            sent += count
+            if after_batch:
+                after_batch([tag for _, tag in batch])
+    finally:
+        connection.close()
+    return sent
+
+
+def send_overdue_digests(user_ids, today=None):
+    """
+    Email each student in ``user_ids`` one digest of all their overdue loans.
+
+    Messages go out through one connection in batches of
+    ``REMINDER_BATCH_SIZE``, and each batch's loans are logged to the
+    reminder ledger so a retried run skips them. The run's throughput is
+    logged and returned.
+    """
+    today = today or timezone.localdate()
+    started = time.monotonic()
+    stats = {'users': 0, 'loans': 0}
+
+    def messages():
+        for message, loan_ids in overdue_digests(user_ids, today):
+            stats['users'] += 1
+            stats['loans'] += len(loan_ids)
+            yield message, loan_ids
+
+    def log_batch(loan_id_lists):
+        record_reminders([tx_id for loan_ids in loan_id_lists for tx_id in loan_ids], 'OVERDUE', today)
+
+    stats['sent'] = send_in_batches(messages(), after_batch=log_batch)
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    logger.info(
+        "Sent %d overdue digests covering %d loans for %d students in %.2fs (%.0f messages/s)",
+        stats['sent'], stats['loans'], stats['users'], stats['seconds'],
+        stats['sent'] / stats['seconds'] if stats['seconds'] else stats['sent'],
+    )
+    return stats
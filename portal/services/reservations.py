@@ -0,0 +1,135 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import escape
+from portal.models import BookReservation
+from portal.services.notifications import enqueue, user_notification
+
+HOLD_HOURS = 48
+ACTIVE_STATUSES = ('WAITING', 'AVAILABLE')
+
+
+def _waiting(book_id):
+    """The book's queue, oldest first, locked without waiting on rows another promotion holds."""
+    return (
+        BookReservation.objects.select_for_update(skip_locked=True, of=('self',))
+        .filter(book_id=book_id, status='WAITING')
+        .order_by('created_at', 'pk')
+    )
+
+
+def _hold(reservation_ids, now):
+    return BookReservation.objects.filter(pk__in=reservation_ids).update(
+        status='AVAILABLE', available_at=now, expires_at=now + timedelta(hours=HOLD_HOURS),
+    )
+
+
+def _hold_available(user_id, username, title):
+    return user_notification(
+        user_id, username, "Reservation Available!",
+        f"Your reserved book '{escape(title)}' is now available. You have {HOLD_HOURS} hours to collect it.",
+        'success', email=True,
+    )
+
+
+def _hold_expired(user_id, username, title):
+    return user_notification(
+        user_id, username, "Reservation Expired",
+        f"Your hold on '{escape(title)}' was not collected in time and has been released.",
+        'warning', email=True,
+    )
+
+
+def promote_next(book, exclude=None):
+    """
+    Put a copy of ``book`` on hold for the longest-waiting reservation and return it, or ``None``.
+
+    The caller owns the copy being handed over; the shelf count is not
+    touched here. The head of the queue is one seek on
+    ``reservation_queue_idx``, and concurrent promotions skip each other's
+    locked rows rather than promote the same student twice. The student's
+    notification is queued in the same transaction.
+    """
+    with transaction.atomic():
+        waiting = _waiting(book.pk)
+        if exclude is not None:
+            waiting = waiting.exclude(pk=exclude.pk)
+        reservation = waiting.select_related('user').first()
+        if reservation is not None:
+            now = timezone.now()
+            _hold([reservation.pk], now)
+            reservation.status, reservation.available_at = 'AVAILABLE', now
+            reservation.expires_at = now + timedelta(hours=HOLD_HOURS)
+            enqueue([_hold_available(reservation.user_id, reservation.user.username, book.title)])
+    return reservation
+
+
+def promote_waiting(book_counts, now=None):
+    """
+    Hand ``book_counts`` (book id -> freed copies) to the queues; returns ``(promoted, leftover)``.
+
+    ``promoted`` lists ``(username, book title, book id)`` for every new hold, all
+    written by one UPDATE and announced by one outbox INSERT; ``leftover``
+    counts the copies no one was waiting for, which the caller returns to
+    the shelf.
+    """
+    now = now or timezone.now()
+    promoted, notifications, leftover = [], {}, Counter(book_counts)
+    for book_id, copies in book_counts.items():
+        if copies <= 0:
+            continue
+        queue = _waiting(book_id).values_list('pk', 'user_id', 'user__username', 'book__title')[:copies]
+        for reservation_id, user_id, username, title in queue:
+            notifications[reservation_id] = _hold_available(user_id, username, title)
+            promoted.append((username, title, book_id))
+            leftover[book_id] -= 1
+    if notifications:
+        _hold(notifications, now)
+        enqueue(notifications.values())
+    return promoted, +leftover
+
+
+def expire_holds(now=None):
+    """
+    Mark AVAILABLE holds past ``expires_at`` as EXPIRED in one UPDATE and queue the students' notifications.
+
+    Returns ``(expired, book_counts)``: ``(username, book title)`` per
+    expired hold and the copies each book got back.
+    """
+    now = now or timezone.now()
+    rows = list(
+        BookReservation.objects.select_for_update(skip_locked=True, of=('self',))
+        .filter(status='AVAILABLE', expires_at__lt=now)
+        .values_list('pk', 'book_id', 'user_id', 'user__username', 'book__title')
+    )
+    if not rows:
+        return [], Counter()
+    BookReservation.objects.filter(pk__in=[row[0] for row in rows]).update(status='EXPIRED')
+    enqueue([_hold_expired(user_id, username, title) for _, _, user_id, username, title in rows])
+    return [(username, title) for _, _, _, username, title in rows], Counter(row[1] for row in rows)
+
+
+def fulfil_holds(pairs):
+    """
+    Mark the AVAILABLE holds of ``(user_id, book_id)`` pairs as FULFILLED; returns the pairs that had one.
+
+    A student collecting a held book takes the copy already set aside for
+    them, so the shelf count must not be decremented for these pairs.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    holds = {
+        (user_id, book_id): reservation_id
+        for reservation_id, user_id, book_id in BookReservation.objects.select_for_update(of=('self',)).filter(
+            status='AVAILABLE',
+            user_id__in={user_id for user_id, _ in pairs},
+            book_id__in={book_id for _, book_id in pairs},
+        ).values_list('pk', 'user_id', 'book_id')
+        if (user_id, book_id) in pairs
+    }
+    if holds:
+        BookReservation.objects.filter(pk__in=holds.values()).update(status='FULFILLED')
+    return set(holds)
@@ -0,0 +1,182 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from portal.models import Book, DailyCirculationStat, Transaction
+from portal.utils import issued_between
+
+COUNTERS = ('issues', 'returns', 'overdues', 'fines')
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _apply_delta(day, book_id, **deltas):
+    department_id, category_id = Book.objects.values_list('department_id', 'category_id').get(pk=book_id)
+    _apply_bucket_delta(day, department_id, category_id, **deltas)
+
+
+def _apply_bucket_delta(day, department_id, category_id, **deltas):
+    # get_or_create falls back to a get when a concurrent writer wins the unique bucket constraint
+    with transaction.atomic():
+        row, created = DailyCirculationStat.objects.get_or_create(
+            date=day, department_id=department_id, category_id=category_id, defaults=deltas,
+        )
+        if not created:
+            DailyCirculationStat.objects.filter(pk=row.pk).update(**{name: F(name) + value for name, value in deltas.items()})
+
+
+def record_issue(loan):
+    """Count a new loan on the day it was issued."""
+    _apply_delta(_as_date(loan.issued_on), loan.book_id, issues=1)
+
+
+def record_return(loan):
+    """Count a return, and the fine charged on it, on the day it came back."""
+    _apply_delta(_as_date(loan.returned_on), loan.book_id, returns=1, fines=Decimal(loan.fine_amount or 0))
+
+
+def _apply_loans(loans, delta):
+    """Fold ``delta(loan) -> (day, counters)`` for many loans, one update per day/department/category."""
+    groups = {}
+    for loan in loans:
+        groups.setdefault(loan.book_id, []).append(delta(loan))
+    buckets = defaultdict(lambda: defaultdict(int))
+    for book_id, department_id, category_id in Book.objects.filter(pk__in=groups).values_list(
+        'id', 'department_id', 'category_id'
+    ):
+        for day, counters in groups[book_id]:
+            for name, value in counters.items():
+                buckets[day, department_id, category_id][name] += value
+    for (day, department_id, category_id), deltas in buckets.items():
+        _apply_bucket_delta(day, department_id, category_id, **deltas)
+
+
+def record_issues(loans):
+    """Bulk ``record_issue`` for loans created without signals (e.g. by ``bulk_create``)."""
+    _apply_loans(loans, lambda loan: (_as_date(loan.issued_on), {'issues': 1}))
+
+
+def record_returns(loans):
+    """Bulk ``record_return``."""
+    _apply_loans(
+        loans, lambda loan: (_as_date(loan.returned_on), {'returns': 1, 'fines': Decimal(loan.fine_amount or 0)})
+    )
+
+
+def compute_daily_stats(start, end):
+    """
+    Aggregate ``Transaction`` into ``{(date, department_id, category_id): counters}`` for ``start``..``end``.
+
+    A loan counts as overdue on its due date if it was still out at the end of
+    that day, so only days before today are counted.
+    """
+    buckets = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    group = {'department_id': F('book__department_id'), 'category_id': F('book__category_id')}
+
+    issued = (
+        Transaction.objects.filter(**issued_between('issued_on', start, end))
+        .values(day=TruncDate('issued_on'), **group)
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in issued:
+        buckets[row['day'], row['department_id'], row['category_id']]['issues'] += row['n']
+
+    returned = (
+        Transaction.objects.filter(returned_on__range=(start, end))
+        .values(day=F('returned_on'), **group)
+        .annotate(n=Count('id'), total_fines=Sum('fine_amount'))
+        .order_by()
+    )
+    for row in returned:
+        bucket = buckets[row['day'], row['department_id'], row['category_id']]
+        bucket['returns'] += row['n']
+        bucket['fines'] += row['total_fines'] or 0
+
+    last_closed_day = min(end, timezone.localdate() - timedelta(days=1))
+    overdue = (
+        Transaction.objects.filter(due_date__range=(start, last_closed_day))
+        .filter(Q(returned_on__isnull=True) | Q(returned_on__gt=F('due_date')))
+        .values(day=F('due_date'), **group)
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in overdue:
+        buckets[row['day'], row['department_id'], row['category_id']]['overdues'] += row['n']
+    return buckets
+
+
+def rollup_range(start, end, batch_size=1000):
+    """Recompute the rollup rows for ``start``..``end`` (inclusive). Returns the number of rows written."""
+    buckets = compute_daily_stats(start, end)
+    objs = [
+        DailyCirculationStat(date=day, department_id=department_id, category_id=category_id, **counters)
+        for (day, department_id, category_id), counters in buckets.items()
+    ]
+    with transaction.atomic():
+        DailyCirculationStat.objects.filter(date__range=(start, end)).delete()
+        DailyCirculationStat.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
+
+
+def rollup_recent(days=2):
+    """Settle the last ``days`` days, up to and including today."""
+    today = timezone.localdate()
+    return rollup_range(today - timedelta(days=days - 1), today)
+
+
+def rollup_history(batch_days=90):
+    """Rebuild the whole rollup from the first transaction onwards, ``batch_days`` at a time."""
+    first = Transaction.objects.order_by('issued_on').values_list('issued_on', flat=True).first()
+    if first is None:
+        DailyCirculationStat.objects.all().delete()
+        return 0
+    start, today, rows = _as_date(first), timezone.localdate(), 0
+    DailyCirculationStat.objects.filter(date__lt=start).delete()
+    while start <= today:
+        end = min(start + timedelta(days=batch_days - 1), today)
+        rows += rollup_range(start, end)
+        start = end + timedelta(days=1)
+    return rows
+
+
+def _stats(start=None, end=None):
+    stats = DailyCirculationStat.objects.all()
+    if start is not None:
+        stats = stats.filter(date__gte=start)
+    if end is not None:
+        stats = stats.filter(date__lte=end)
+    return stats
+
+
+def issues_per_department(start=None, end=None):
+    """Return ``[(department name or None, issues)]``, busiest department first."""
+    return list(
+        _stats(start, end)
+        .values(department_name=F('department__name'))
+        .annotate(issues=Sum('issues'))
+        .filter(issues__gt=0)
+        .order_by('-issues')
+        .values_list('department_name', 'issues')
+    )
+
+
+def issues_per_month(start=None, end=None):
+    """Return ``[(first day of month, issues)]`` in date order."""
+    return list(
+        _stats(start, end)
+        .annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(total=Sum('issues'))
+        .filter(total__gt=0)
+        .order_by('month')
+        .values_list('month', 'total')
+    )
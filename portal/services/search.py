@@ -0,0 +1,421 @@
+import hashlib
+import logging
+import math
+import operator
+import os
+import pickle
+import re
+import threading
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Q
+
+# PostgreSQL full-text search (optional, with SQLite fallback)
+try:
+    from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+    HAS_POSTGRES_SEARCH = True
+except ImportError:
+    HAS_POSTGRES_SEARCH = False
+
+from portal.models import Book, CacheGeneration
+from portal.services.pagination import paginate_list
+
+# Text search configuration shared by the stored column, its trigger and queries.
+SEARCH_CONFIG = 'english'
+
+# Longest ranking a single query returns.
+MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+RESULTS_CACHE_TTL = getattr(settings, 'SEARCH_RESULTS_CACHE_TTL', 300)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Partial words match indexed terms they prefix, at a discount.
+PREFIX_WEIGHT = 0.5
+PREFIX_EXPANSIONS = 20
+
+logger = logging.getLogger(__name__)
+
+
+def uses_postgres_search():
+    return HAS_POSTGRES_SEARCH and connection.vendor == 'postgresql'
+
+
+def book_search_vector():
+    """Weighted document expression matching the ``portal_book`` search trigger."""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('author', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('subject', weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def ranked_search(query, queryset=None):
+    """Match ``query`` (text or a ``SearchQuery``) against the stored ``search_vector`` column, best matches first."""
+    if queryset is None:
+        queryset = Book.objects.all()
+    search_query = query if isinstance(query, SearchQuery) else SearchQuery(query, search_type='plain', config=SEARCH_CONFIG)
+    return (
+        queryset
+        .filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-rank', '-created_at')
+    )
+
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Bumped on every catalog change so other workers notice their index is stale. The counter
+# lives in the database: a per-process cache would hide the bump from other workers, and a
+# restarted worker would take an old snapshot for current.
+GENERATION_NAME = 'search_index'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def catalog_generation(name=GENERATION_NAME):
+    return CacheGeneration.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+def bump_catalog_generation(name=GENERATION_NAME):
+    """
+    Increment the ``name`` counter and return its new value.
+
+    The UPDATE locks the row until commit, so concurrent bumps are
+    serialized: a caller whose old generation is exactly one below the
+    returned value knows no other change slipped in between.
+    """
+    counter = CacheGeneration.objects.filter(name=name)
+    with transaction.atomic():
+        if not counter.update(value=F('value') + 1):
+            CacheGeneration.objects.get_or_create(name=name)
+            counter.update(value=F('value') + 1)
+        return counter.values_list('value', flat=True).get()
+
+
+class SearchBackend:
+    """
+    Ranks catalog matches for a free-text query.
+
+    ``search`` returns ``[(book_id, score)]`` best first, at most ``limit``
+    long. ``field`` restricts matching to one of ``SEARCHABLE_FIELDS``;
+    ``match_any`` lets a multi-word query match books containing any word.
+    """
+
+    def search(self, query, field=None, limit=None, match_any=False):
+        raise NotImplementedError
+
+    def book_changed(self, book, update_fields=None, created=False):
+        if indexed_fields_changed(book, INDEXED_FIELDS, update_fields, created):
+            bump_catalog_generation()
+
+    def book_removed(self, book_id):
+        bump_catalog_generation()
+
+
+SEARCHABLE_FIELDS = ('title', 'author', 'subject')
+INDEXED_FIELDS = SEARCHABLE_FIELDS + ('description',)
+
+
+def remember_indexed_fields(book):
+    """Note the indexed values ``book`` was loaded or last saved with, for ``indexed_fields_changed``."""
+    # Read from __dict__ so deferred fields stay deferred.
+    book._loaded_indexed_fields = {field: book.__dict__[field] for field in INDEXED_FIELDS if field in book.__dict__}
+
+
+def indexed_fields_changed(book, fields=INDEXED_FIELDS, update_fields=None, created=False):
+    """
+    Whether saving ``book`` changed any of ``fields``, judged by the values it was loaded with.
+
+    The answer depends only on the row, never on what this process happens
+    to have indexed, so a save that leaves ``fields`` alone (a copy count, a
+    shelf mark) bumps no generation in any process.
+    """
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return False
+    loaded = getattr(book, '_loaded_indexed_fields', None)
+    if created or loaded is None:
+        return True
+    return any(
+        field not in loaded or book.__dict__[field] != loaded[field]
+        for field in fields if field in book.__dict__
+    )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Full-text search over the stored, GIN-indexed ``search_vector`` column.
+
+    The trigger keeps the column current, so Book changes only bump the
+    catalog generation that keys cached result lists.
+    """
+
+    def search(self, query, field=None, limit=None, match_any=False):
+        limit = limit or MAX_RESULTS
+        if field is not None:
+            # Single-field lookups are served by the trigram indexes (migration 0017).
+            books = Book.objects.filter(**{f'{field}__icontains': query}).order_by('-created_at')
+            return [(book_id, 1.0) for book_id in books.values_list('id', flat=True)[:limit]]
+
+        search_query = self._search_query(query, match_any)
+        ranking = []
+        if search_query is not None:
+            ranking = list(ranked_search(search_query).values_list('id', 'rank')[:limit])
+        if ranking:
+            return ranking
+        # Fallback for partial words the stemmer cannot match
+        terms = query.split() if match_any else [query]
+        condition = Q()
+        for term in terms:
+            condition |= Q(title__icontains=term) | Q(author__icontains=term) | Q(subject__icontains=term)
+        books = Book.objects.filter(condition).order_by('-created_at')
+        return [(book_id, 1.0) for book_id in books.values_list('id', flat=True)[:limit]]
+
+    def _search_query(self, query, match_any):
+        if not match_any:
+            return SearchQuery(query, search_type='plain', config=SEARCH_CONFIG)
+        terms = [SearchQuery(term, search_type='plain', config=SEARCH_CONFIG) for term in query.split()]
+        return reduce(operator.or_, terms) if terms else None
+
+
+class InvertedIndex:
+    """Per-field postings (``term -> {book_id: term frequency}``) plus the statistics BM25 needs."""
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.postings = {field: defaultdict(dict) for field in self.fields}
+        self.lengths = {field: {} for field in self.fields}
+        self.total_length = dict.fromkeys(self.fields, 0)
+        self.created = {}
+        self.doc_terms = {}
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self.created)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_vocabulary'] = None
+        return state
+
+    def add(self, book_id, created_ts, values):
+        self.remove(book_id)
+        self.created[book_id] = created_ts
+        doc_terms = self.doc_terms[book_id] = {}
+        for field in self.fields:
+            tokens = tokenize(values.get(field))
+            self.lengths[field][book_id] = len(tokens)
+            self.total_length[field] += len(tokens)
+            postings = self.postings[field]
+            counts = Counter(tokens)
+            for term, tf in counts.items():
+                postings[term][book_id] = tf
+            doc_terms[field] = counts
+        self._vocabulary = None
+
+    def remove(self, book_id):
+        if self.created.pop(book_id, None) is None:
+            return
+        doc_terms = self.doc_terms.pop(book_id)
+        for field in self.fields:
+            self.total_length[field] -= self.lengths[field].pop(book_id, 0)
+            postings = self.postings[field]
+            for term in doc_terms[field]:
+                del postings[term][book_id]
+                if not postings[term]:
+                    del postings[term]
+        self._vocabulary = None
+
+    def expand(self, term, limit=PREFIX_EXPANSIONS):
+        """Indexed terms that extend ``term``, so partial words still match."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted({t for postings in self.postings.values() for t in postings})
+        vocabulary = self._vocabulary
+        pos = bisect_right(vocabulary, term)
+        expansions = []
+        while pos < len(vocabulary) and len(expansions) < limit and vocabulary[pos].startswith(term):
+            expansions.append(vocabulary[pos])
+            pos += 1
+        return expansions
+
+    def score(self, terms, weights):
+        """BM25 summed over ``weights``' fields, each field score scaled by its weight."""
+        n = len(self.created)
+        scores = defaultdict(float)
+        for field, weight in weights.items():
+            postings, lengths = self.postings[field], self.lengths[field]
+            avg_length = (self.total_length[field] / n) if n else 0
+            for term, term_weight in terms:
+                docs = postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for book_id, tf in docs.items():
+                    norm = 1 - BM25_B + BM25_B * (lengths[book_id] / avg_length if avg_length else 0)
+                    scores[book_id] += weight * term_weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+
+class InMemorySearchBackend(SearchBackend):
+    """
+    In-process BM25 index for deployments without PostgreSQL.
+
+    Built from the database on first use, or loaded from the pickled
+    snapshot written by ``manage.py build_search_index`` when it still
+    matches the catalog. Book saves and deletes patch it in place; other
+    workers see the bumped generation in the database and rebuild on their
+    next query, at the cost of one primary-key read per query.
+    """
+
+    FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'subject': 1.5, 'description': 0.5}
+
+    def __init__(self, snapshot_path=None):
+        self.snapshot_path = snapshot_path
+        self.index = None
+        self.generation = None
+        self._lock = threading.RLock()
+
+    def reset(self):
+        """Drop the index; the next query rebuilds or reloads it."""
+        with self._lock:
+            self.index = None
+            self.generation = None
+
+    def build(self):
+        index = InvertedIndex(self.FIELD_WEIGHTS)
+        generation = catalog_generation()
+        rows = Book.objects.values_list('id', 'created_at', *self.FIELD_WEIGHTS).iterator(chunk_size=2000)
+        for book_id, created_at, *values in rows:
+            index.add(book_id, created_at.timestamp(), dict(zip(self.FIELD_WEIGHTS, values)))
+        with self._lock:
+            self.index, self.generation = index, generation
+        return index
+
+    def _fingerprint(self):
+        stats = Book.objects.aggregate(count=Count('id'), last_id=Max('id'))
+        return stats['count'], stats['last_id']
+
+    def save_snapshot(self, path=None):
+        path = path or self.snapshot_path
+        index = self.build()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        snapshot = {'generation': self.generation, 'fingerprint': self._fingerprint(), 'index': index}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as fh:
+            pickle.dump(snapshot, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return len(index)
+
+    def load_snapshot(self, path=None):
+        """Adopt the snapshot at ``path`` if it matches the current catalog. Returns True on success."""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as fh:
+                snapshot = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            logger.warning("Ignoring unreadable search index snapshot %s", path)
+            return False
+        if snapshot['generation'] != catalog_generation() or snapshot['fingerprint'] != self._fingerprint():
+            return False
+        with self._lock:
+            self.index, self.generation = snapshot['index'], snapshot['generation']
+        return True
+
+    def _current_index(self):
+        with self._lock:
+            index = self.index
+            if index is not None and self.generation == catalog_generation():
+                return index
+        if index is None and self.load_snapshot():
+            return self.index
+        return self.build()
+
+    def search(self, query, field=None, limit=None, match_any=False):
+        limit = limit or MAX_RESULTS
+        words = tokenize(query)
+        if not words:
+            return []
+        terms = {}
+        index = self._current_index()
+        with self._lock:
+            for word in words:
+                terms[word] = 1.0
+                for expansion in index.expand(word):
+                    terms.setdefault(expansion, PREFIX_WEIGHT)
+            weights = {field: self.FIELD_WEIGHTS[field]} if field else self.FIELD_WEIGHTS
+            scores = index.score(terms.items(), weights)
+            created = index.created
+            ranking = sorted(scores.items(), key=lambda item: (-item[1], -created[item[0]], -item[0]))
+        return ranking[:limit]
+
+    def book_changed(self, book, update_fields=None, created=False):
+        if not indexed_fields_changed(book, INDEXED_FIELDS, update_fields, created):
+            return  # e.g. only the copy counters changed
+        values = {field: getattr(book, field) for field in self.FIELD_WEIGHTS}
+        self._apply(lambda index: index.add(book.id, book.created_at.timestamp(), values))
+
+    def book_removed(self, book_id):
+        self._apply(lambda index: index.remove(book_id))
+
+    def _apply(self, change):
+        with self._lock:
+            generation = bump_catalog_generation()
+            if self.index is not None and self.generation == generation - 1:
+                change(self.index)
+                self.generation = generation
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the process-wide backend chosen by ``settings.SEARCH_BACKEND`` (``auto``, ``postgres`` or ``memory``)."""
+    global _backend
+    if _backend is None:
+        choice = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if choice == 'postgres' or (choice == 'auto' and uses_postgres_search()):
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = InMemorySearchBackend(getattr(settings, 'SEARCH_INDEX_SNAPSHOT', None))
+    return _backend
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+def cached_search(query, field=None):
+    """
+    Return the full ranking for ``query``, computed at most once per catalog generation.
+
+    Result pages of the same query are sliced from the cached id list, so
+    the ranked query runs once per search rather than once per page.
+    """
+    query = normalize_query(query)
+    digest = hashlib.md5(query.encode()).hexdigest()
+    cache_key = f"search_results_{catalog_generation()}_{field or 'all'}_{digest}"
+    ranking = cache.get(cache_key)
+    if ranking is None:
+        ranking = get_search_backend().search(query, field=field)
+        cache.set(cache_key, ranking, RESULTS_CACHE_TTL)
+    return ranking
+
+
+def hydrate_books(ranking):
+    """Load the books of a ranking in one query, keeping rank order."""
+    books = Book.objects.select_related('department').in_bulk([book_id for book_id, _ in ranking])
+    return [books[book_id] for book_id, _ in ranking if book_id in books]
+
+
+def paginate_ranking(ranking, cursor=None, per_page=12):
+    """Page through a ranking in Python and hydrate only the requested page."""
+    return paginate_list(ranking, cursor, per_page, hydrate=hydrate_books)
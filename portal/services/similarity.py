@@ -0,0 +1,139 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Sum, When
+from portal.models import Transaction, BookSimilarity
+
+SIMILARITY_TOP_K = getattr(settings, 'RECOMMENDER_SIMILARITY_TOP_K', 50)
+
+
+def borrow_pairs(transaction_model=Transaction):
+    """Distinct ``(user_id, book_id)`` borrows grouped by user, streamed for ``co_borrow_neighbours``."""
+    return (
+        transaction_model.objects
+        .values_list('user_id', 'book_id')
+        .distinct()
+        .order_by('user_id')
+        .iterator(chunk_size=5000)
+    )
+
+
+def co_borrow_neighbours(borrows, top_k=SIMILARITY_TOP_K):
+    """
+    Yield ``(book_id, similar_book_id, score)`` for the ``top_k`` strongest neighbours of each book.
+
+    Each user's distinct borrow set in ``borrows`` (``(user_id, book_id)``
+    pairs ordered by user) contributes one count to every pair of books in it.
+    """
+    pair_counts = Counter()
+    for _, group in groupby(borrows, key=itemgetter(0)):
+        book_ids = sorted({book_id for _, book_id in group})
+        for pair in combinations(book_ids, 2):
+            pair_counts[pair] += 1
+
+    neighbours = defaultdict(list)
+    for (a, b), count in pair_counts.items():
+        neighbours[a].append((count, b))
+        neighbours[b].append((count, a))
+
+    for book_id, candidates in neighbours.items():
+        for count, other_id in heapq.nlargest(top_k, candidates):
+            yield book_id, other_id, count
+
+
+def rebuild_similarity_matrix(top_k=SIMILARITY_TOP_K, batch_size=1000):
+    """
+    Recompute the co-borrow table from the full transaction history.
+
+    Only the ``top_k`` strongest neighbours of each book are kept. Returns
+    the number of rows written.
+    """
+    objs = [
+        BookSimilarity(book_id=book_id, similar_book_id=other_id, score=count)
+        for book_id, other_id, count in co_borrow_neighbours(borrow_pairs(), top_k)
+    ]
+    with transaction.atomic():
+        BookSimilarity.objects.all().delete()
+        BookSimilarity.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
+
+
+def record_borrow(user_id, book_id):
+    """
+    Fold a single new borrow into the co-borrow table.
+
+    Only a user's first borrow of a book changes the counts. Pairs that are
+    new to the table are inserted with a score of 1; trimming back to the
+    top-K neighbours is left to the periodic rebuild.
+    """
+    record_borrows([(user_id, book_id)])
+
+
+def record_borrows(borrows):
+    """
+    Bulk ``record_borrow`` for ``(user_id, book_id)`` loans already written, e.g. by ``issue_batch``.
+
+    One query reads every borrower's history; the pair deltas are summed in
+    Python, so two books first borrowed together count once, and applied
+    with one grouped UPDATE plus one ``bulk_create``.
+    """
+    new_books = defaultdict(set)
+    for user_id, book_id in borrows:
+        new_books[user_id].add(book_id)
+    if not new_books:
+        return
+    history = defaultdict(Counter)
+    for user_id, book_id in Transaction.objects.filter(user_id__in=new_books).values_list('user_id', 'book_id'):
+        history[user_id][book_id] += 1
+
+    deltas = Counter()
+    for user_id, book_ids in new_books.items():
+        borrowed = history[user_id]
+        first = {book_id for book_id in book_ids if borrowed[book_id] == 1}
+        pairs = [(book_id, other_id) for book_id in first for other_id in set(borrowed) - first]
+        pairs += combinations(sorted(first), 2)
+        for a, b in pairs:
+            deltas[a, b] += 1
+            deltas[b, a] += 1
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        existing = {
+            (a, b): pk
+            for pk, a, b in BookSimilarity.objects.filter(
+                book_id__in={a for a, _ in deltas}, similar_book_id__in={b for _, b in deltas},
+            ).values_list('pk', 'book_id', 'similar_book_id')
+            if (a, b) in deltas
+        }
+        if existing:
+            BookSimilarity.objects.filter(pk__in=existing.values()).update(score=Case(
+                *[When(pk=pk, then=F('score') + deltas[pair]) for pair, pk in existing.items()],
+                default=F('score'),
+                output_field=PositiveIntegerField(),
+            ))
+        BookSimilarity.objects.bulk_create(
+            [
+                BookSimilarity(book_id=a, similar_book_id=b, score=count)
+                for (a, b), count in deltas.items() if (a, b) not in existing
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def similar_book_scores(book_ids, exclude_ids=()):
+    """Return ``{book_id: summed co-borrow score}`` for the neighbours of ``book_ids``."""
+    if not book_ids:
+        return {}
+    rows = (
+        BookSimilarity.objects
+        .filter(book_id__in=book_ids)
+        .exclude(similar_book_id__in=exclude_ids)
+        .values('similar_book_id')
+        .annotate(score=Sum('score'))
+    )
+    return {row['similar_book_id']: row['score'] for row in rows}
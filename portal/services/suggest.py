@@ -0,0 +1,149 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+from django.db.models import Q
+from portal.models import Book
+from portal.services.search import (
+    bump_catalog_generation, catalog_generation, indexed_fields_changed, uses_postgres_search,
+)
+
+WORD_START = re.compile(r'\w+')
+# Counter bumped on every title or author change, so other workers' indexes notice they are stale
+GENERATION_NAME = 'suggestion_index'
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def prefix_keys(*fields):
+    """Every suffix of the normalized fields that starts at a word boundary."""
+    keys = set()
+    for field in fields:
+        text = normalize(field)
+        for match in WORD_START.finditer(text):
+            keys.add(text[match.start():])
+    return keys
+
+
+class PrefixIndex:
+    """
+    In-process typeahead index for deployments without PostgreSQL.
+
+    Keeps a sorted array of ``(key, book_id)`` pairs, one per word-start
+    suffix of each title and author, so a prefix lookup is a bisect plus a
+    short forward scan. Built lazily on first use and patched per book on
+    save; a change made by another worker bumps the shared generation and
+    the next lookup here rebuilds.
+    """
+
+    FIELDS = ('title', 'author')
+
+    def __init__(self):
+        self._entries = []
+        self._keys_by_book = {}
+        self._titles = {}
+        self.generation = None
+        self._lock = threading.RLock()
+
+    def build(self):
+        with self._lock:
+            generation = catalog_generation(GENERATION_NAME)
+            entries, keys_by_book, titles = [], {}, {}
+            for book_id, title, author in Book.objects.values_list('id', *self.FIELDS).iterator():
+                keys = prefix_keys(title, author)
+                keys_by_book[book_id] = keys
+                titles[book_id] = title
+                entries.extend((key, book_id) for key in keys)
+            entries.sort()
+            self._entries, self._keys_by_book, self._titles = entries, keys_by_book, titles
+            self.generation = generation
+
+    def invalidate(self):
+        """Drop the index; the next lookup rebuilds it from the database."""
+        with self._lock:
+            self.generation = None
+
+    def _remove(self, book_id):
+        for key in self._keys_by_book.pop(book_id, ()):
+            pos = bisect_left(self._entries, (key, book_id))
+            if pos < len(self._entries) and self._entries[pos] == (key, book_id):
+                del self._entries[pos]
+        self._titles.pop(book_id, None)
+
+    def _add(self, book_id, title, keys):
+        self._keys_by_book[book_id] = keys
+        self._titles[book_id] = title
+        for key in keys:
+            insort(self._entries, (key, book_id))
+
+    def update_book(self, book, update_fields=None, created=False):
+        # PostgreSQL serves suggestions from trigram indexes; this index is never read there
+        if uses_postgres_search() or not indexed_fields_changed(book, self.FIELDS, update_fields, created):
+            return
+        keys = prefix_keys(book.title, book.author)
+
+        def change():
+            self._remove(book.id)
+            self._add(book.id, book.title, keys)
+
+        self._apply(change)
+
+    def remove_book(self, book_id):
+        if not uses_postgres_search():
+            self._apply(lambda: self._remove(book_id))
+
+    def _apply(self, change):
+        """Bump the generation, patching the index in place when no other change came in between."""
+        with self._lock:
+            generation = bump_catalog_generation(GENERATION_NAME)
+            if self.generation is not None and self.generation == generation - 1:
+                change()
+                self.generation = generation
+
+    def suggest(self, query, limit=5):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        with self._lock:
+            if self.generation != catalog_generation(GENERATION_NAME):
+                self.build()
+            pos = bisect_left(self._entries, (prefix,))
+            while pos < len(self._entries) and len(results) < limit:
+                key, book_id = self._entries[pos]
+                if not key.startswith(prefix):
+                    break
+                if book_id not in seen:
+                    seen.add(book_id)
+                    results.append(self._titles[book_id])
+                pos += 1
+        return results
+
+
+suggestion_index = PrefixIndex()
+
+
+def suggest_titles(query, limit=5):
+    """
+    Return up to ``limit`` book titles for a typeahead ``query``.
+
+    On PostgreSQL the prefix and substring lookups are served by the
+    pg_trgm GIN indexes on title/author (migration 0017); elsewhere the
+    in-process ``suggestion_index`` answers without touching the database.
+    """
+    if not uses_postgres_search():
+        return suggestion_index.suggest(query, limit)
+
+    query = query.strip()
+    results = list(
+        Book.objects.filter(Q(title__istartswith=query) | Q(author__istartswith=query))
+        .order_by('title')
+        .values_list('title', flat=True)[:limit]
+    )
+    if len(results) < limit:
+        results += Book.objects.filter(
+            Q(title__icontains=query) | Q(author__icontains=query)
+        ).exclude(title__in=results).order_by('title').values_list('title', flat=True)[:limit - len(results)]
+    return results
@@ -1,18 +1,74 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.core.cache import cache
-from .models import Profile, Transaction, BookRequest
+from .models import Book, Profile, Transaction, BookRequest
+from .services.similarity import record_borrow
+from .services.popularity import record_issue, record_return
+from .services import rollup as circulation_rollup
+from .services.recommender import recommendation_cache_key
+from .services.facets import bump_facet_generation
+from .services.kpis import student_kpis_cache_key
+from .services import live_dashboard
+from .services.search import get_search_backend, remember_indexed_fields
+from .services.suggest import suggestion_index
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.get_or_create(user=instance)
 
+@receiver(post_save, sender=Transaction)
+def invalidate_student_kpis(sender, instance, **kwargs):
+    cache.delete(student_kpis_cache_key(instance.user_id))
+
 @receiver(post_save, sender=Transaction)
 def invalidate_recommendation_cache(sender, instance, **kwargs):
-    cache_key = f"recommendations_{instance.user.id}"
-    cache.delete(cache_key)
+    # The snapshot is kept; rank_recommendations drops books borrowed since it was computed.
+    cache.delete(recommendation_cache_key(instance.user_id))
+
+@receiver(post_save, sender=Transaction)
+def update_book_similarity(sender, instance, created, **kwargs):
+    if created:
+        record_borrow(instance.user_id, instance.book_id)
+
+@receiver(post_init, sender=Transaction)
+def remember_loaded_return(sender, instance, **kwargs):
+    # Read from __dict__ so deferred-field querysets don't trigger a refresh.
+    instance._loaded_returned_on = instance.__dict__.get('returned_on')
+
+@receiver(post_save, sender=Transaction)
+def update_circulation_counters(sender, instance, created, **kwargs):
+    if created:
+        record_issue(instance.book_id)
+        circulation_rollup.record_issue(instance)
+    if instance.returned_on is not None and (created or instance._loaded_returned_on is None):
+        record_return(instance.book_id)
+        circulation_rollup.record_return(instance)
+    instance._loaded_returned_on = instance.returned_on
+
+@receiver(post_init, sender=Book)
+def remember_loaded_indexed_fields(sender, instance, **kwargs):
+    remember_indexed_fields(instance)
+
+@receiver(post_save, sender=Book)
+def refresh_search_indexes(sender, instance, created, update_fields=None, **kwargs):
+    suggestion_index.update_book(instance, update_fields, created)
+    get_search_backend().book_changed(instance, update_fields, created)
+    remember_indexed_fields(instance)
+
+@receiver(post_delete, sender=Book)
+def drop_from_suggestion_index(sender, instance, **kwargs):
+    suggestion_index.remove_book(instance.id)
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_facets(sender, **kwargs):
+    bump_facet_generation()
+
+@receiver(post_delete, sender=Book)
+def drop_from_search_index(sender, instance, **kwargs):
+    get_search_backend().book_removed(instance.id)
 
 @receiver(post_save, sender=BookRequest)
 def send_request_notification(sender, instance, created, **kwargs):
@@ -23,3 +79,16 @@ def send_request_notification(sender, instance, created, **kwargs):
             send_request_approval_email.delay(instance.id, approved)
         except Exception:
             pass
+
+@receiver(post_init, sender=BookRequest)
+def remember_loaded_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=BookRequest)
+def publish_pending_requests(sender, instance, created, **kwargs):
+    # Open librarian dashboards get the new pending count (and a new request) pushed to them,
+    # but only when the save moved a request into or out of PENDING
+    was_pending = not created and instance._loaded_status == 'PENDING'
+    if was_pending != (instance.status == 'PENDING'):
+        live_dashboard.requests_changed(instance if created else None)
+    instance._loaded_status = instance.status
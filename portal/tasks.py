@@ -1,41 +1,37 @@
-from celery import shared_task
+from celery import group, shared_task
+from django.conf import settings
 from django.core.mail import send_mail
 from django.utils import timezone
-from .models import Transaction, BookRequest
-from .utils import calculate_fine
+from django.utils.dateparse import parse_date
+from .models import BookRequest, Profile
+from .services.circulation import sweep_expired_holds
+from .services.live_dashboard import announce_new_overdues
+from .services.notifications import drain_outbox
+from .services.similarity import rebuild_similarity_matrix
+from .services.popularity import reconcile_popularity
+from .services.recommender import precompute_recommendations
+from .services.reminders import (
+    REMINDER_CHUNK_SIZE, chunked, overdue_user_ids, prune_reminder_log, send_due_date_reminders, send_overdue_digests,
+)
+from .services.reports import generate_report
+from .services.rollup import rollup_recent
 
 @shared_task
-def send_overdue_reminders():
-    """Send overdue reminder emails to students with overdue books."""
-    today = timezone.localdate()
-
-    overdue_transactions = Transaction.objects.filter(
-        returned_on__isnull=True,
-        due_date__lt=today
-    ).select_related("user", "book")
+def send_overdue_reminder_chunk(user_ids, today=None):
+    """Email one overdue digest to each student in ``user_ids`` over a shared connection."""
+    stats = send_overdue_digests(user_ids, parse_date(today) if today else None)
+    return f"Sent {stats['sent']} overdue digests covering {stats['loans']} loans in {stats['seconds']}s."
 
-    for tx in overdue_transactions:
-        fine = calculate_fine(tx.due_date, today)
-
-        subject = f"Overdue Book Reminder – '{tx.book.title}'"
-        message = (
-            f"Dear {tx.user.username},\n\n"
-            f"The book '{tx.book.title}' issued to you was due on {tx.due_date}.\n"
-            f"Today's date: {today}\n"
-            f"Days overdue: {(today - tx.due_date).days}\n"
-            f"Current estimated fine: ₹{fine}\n\n"
-            "Please return the book as soon as possible.\n\n"
-            "— Acharya Nagarjuna University Library"
-        )
 
-        if tx.user.email:
-            send_mail(
-                subject,
-                message,
-                "library@anu.ac.in",
-                [tx.user.email],
-                fail_silently=True
-            )
+@shared_task
+def send_overdue_reminders():
+    """Fan overdue reminder digests, one per student not yet reminded today, out across Celery workers."""
+    today = timezone.localdate()
+    prune_reminder_log(today)
+    user_ids = overdue_user_ids(today)
+    chunks = list(chunked(user_ids, REMINDER_CHUNK_SIZE))
+    group(send_overdue_reminder_chunk.s(chunk, today.isoformat()) for chunk in chunks).apply_async()
+    return f"Queued overdue reminders for {len(user_ids)} students in {len(chunks)} chunks."
 
 @shared_task
 def send_request_approval_email(request_id, approved):
@@ -67,43 +63,70 @@ def send_request_approval_email(request_id, approved):
 
 @shared_task
 def send_due_reminders():
-    """Send reminders for upcoming due dates (3 days and 1 day before)."""
-    from datetime import timedelta
-    
-    # 1. Remind 3 Days Before
-    three_days_from_now = timezone.localdate() + timedelta(days=3)
-    upcoming_txs = Transaction.objects.filter(
-        status='ISSUED', 
-        returned_on__isnull=True, 
-        due_date=three_days_from_now
-    ).select_related("user", "book")
-    
-    for tx in upcoming_txs:
-        if tx.user.email:
-            send_mail(
-                subject=f"Library Reminder: '{tx.book.title}' is due in 3 days",
-                message=f"Dear {tx.user.username},\n\nPlease return '{tx.book.title}' on or before {tx.due_date}.",
-                from_email="library@anu.ac.in",
-                recipient_list=[tx.user.email],
-                fail_silently=True,
-            )
+    """Send reminders for upcoming due dates (3 days and 1 day before), skipping loans already reminded today."""
+    counts = send_due_date_reminders()
+    return f"Sent {counts[3]} 3-day reminders and {counts[1]} 1-day reminders."
+
+
+@shared_task
+def rebuild_book_similarity():
+    """Rebuild the item-item co-borrow table used by the recommender."""
+    rows = rebuild_similarity_matrix()
+    return f"Rebuilt book similarity table with {rows} rows."
 
-    # 2. Remind exactly 1 Day Before
-    tomorrow = timezone.localdate() + timedelta(days=1)
-    tomorrow_txs = Transaction.objects.filter(
-        status='ISSUED', 
-        returned_on__isnull=True, 
-        due_date=tomorrow
-    ).select_related("user", "book")
-    
-    for tx in tomorrow_txs:
-        if tx.user.email:
-            send_mail(
-                subject=f"URGENT: '{tx.book.title}' is due tomorrow",
-                message=f"Dear {tx.user.username},\n\nPlease return '{tx.book.title}' tomorrow ({tx.due_date}) to avoid fines.",
-                from_email="library@anu.ac.in",
-                recipient_list=[tx.user.email],
-                fail_silently=True,
-            )
 
-    return f"Sent {upcoming_txs.count()} 3-day reminders and {tomorrow_txs.count()} 1-day reminders."
+@shared_task
+def reconcile_book_popularity():
+    """Recompute book popularity counters and age issues out of the rolling windows."""
+    books = reconcile_popularity()
+    return f"Reconciled popularity counters for {books} books."
+
+
+@shared_task
+def rollup_circulation_stats(days=2):
+    """Settle the daily circulation rollup for the last ``days`` days, counting yesterday's overdues."""
+    rows = rollup_recent(days)
+    return f"Rolled up {rows} daily circulation rows over {days} days."
+
+
+@shared_task
+def publish_new_overdues():
+    """Push the loans that fell overdue overnight to open librarian dashboards."""
+    delta = announce_new_overdues()
+    return f"Published {delta.payload['new_overdue'] if delta else 0} new overdue loans."
+
+
+@shared_task
+def expire_reservation_holds():
+    """Expire uncollected reservation holds and pass the copies down the queues; students are notified via the outbox."""
+    expired, promoted = sweep_expired_holds()
+    return f"Expired {len(expired)} holds and promoted {len(promoted)} reservations."
+
+
+@shared_task
+def dispatch_notifications():
+    """Deliver due notification outbox rows to the channel layer and email, retrying failures with backoff."""
+    return f"Dispatched {drain_outbox()} notifications."
+
+
+@shared_task
+def generate_transactions_report(job_id):
+    """Render a queued transactions PDF to MEDIA_ROOT and notify its owner when it is ready."""
+    job = generate_report(job_id)
+    return f"Report {job.id} {job.status.lower()} with {job.row_count} rows."
+
+
+@shared_task
+def precompute_recommendation_chunk(user_ids):
+    """Score and store recommendation snapshots for one chunk of students."""
+    return precompute_recommendations(user_ids)
+
+
+@shared_task
+def precompute_all_recommendations():
+    """Fan recommendation precomputation for every student out across Celery workers."""
+    chunk_size = getattr(settings, 'RECOMMENDATION_PRECOMPUTE_CHUNK', 500)
+    student_ids = list(Profile.objects.filter(role='student').order_by('user_id').values_list('user_id', flat=True))
+    chunks = [student_ids[i:i + chunk_size] for i in range(0, len(student_ids), chunk_size)]
+    group(precompute_recommendation_chunk.s(chunk) for chunk in chunks).apply_async()
+    return f"Queued recommendation precompute for {len(student_ids)} students in {len(chunks)} chunks."
@@ -20,6 +20,8 @@ urlpatterns = [
     path('transaction/<int:tx_id>/calendar/', views.download_ics, name='download_ics'),
     path('export-transactions-csv/', views.export_transactions_csv, name='export_transactions_csv'),
     path('export-transactions-pdf/', views.export_transactions_pdf, name='export_transactions_pdf'),
+    path('reports/<int:job_id>/', views.report_status, name='report_status'),
+    path('reports/<int:job_id>/download/', views.report_download, name='report_download'),
     path('search-suggestions/', views.search_suggestions, name='search_suggestions'),
     path('search/', views.search_view, name='search'),
     path('advanced-search/', views.advanced_search_view, name='advanced_search'),
@@ -50,6 +52,9 @@ urlpatterns = [
     path('api/most-issued-books/', views.most_issued_books_api, name='most_issued_books_api'),
     path('api/overdue-books/', views.overdue_books_api, name='overdue_books_api'),
     path('api/low-stock-books/', views.low_stock_books_api, name='low_stock_books_api'),
+    path('api/books/', views.books_api, name='books_api'),
+    path('api/notifications/', views.notification_inbox_api, name='notification_inbox_api'),
+    path('api/circulation/batch/', views.circulation_batch_api, name='circulation_batch_api'),
     path('api/student-issued/', views.student_issued_api, name='student_issued_api'),
     path('api/student-history/', views.student_history_api, name='student_history_api'),
 ]
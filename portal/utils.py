@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 import os
 
@@ -12,6 +15,35 @@ def calculate_fine(due_date, returned_date=None):
         return FINE_PER_DAY * delay
     return Decimal('0.00')
 
+def parse_date_range(params):
+    """Read optional ISO ``start``/``end`` dates from request parameters; invalid values are ignored."""
+    bounds = []
+    for name in ('start', 'end'):
+        try:
+            bounds.append(parse_date(params.get(name) or ''))
+        except ValueError:
+            bounds.append(None)
+    return tuple(bounds)
+
+def start_of_day(day):
+    """Midnight opening ``day`` in the current time zone, the same days ``TruncDate`` buckets by."""
+    midnight = datetime.combine(day, time.min)
+    return timezone.make_aware(midnight) if settings.USE_TZ else midnight
+
+def issued_between(field, start=None, end=None):
+    """
+    Lookups keeping datetime ``field`` within the whole days ``start``..``end`` (either may be None).
+
+    Half-open bounds on the bare column, unlike a ``__date`` lookup, can be
+    served by an index on it.
+    """
+    bounds = {}
+    if start:
+        bounds[f'{field}__gte'] = start_of_day(start)
+    if end:
+        bounds[f'{field}__lt'] = start_of_day(end + timedelta(days=1))
+    return bounds
+
 def generate_book_metadata(title, author):
     import json
     api_key = os.environ.get('OPENAI_API_KEY')
@@ -10,40 +10,41 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.db import transaction as db_transaction
 from django.db.models import Q, Count, Sum
 from django.views.decorators.csrf import csrf_exempt
 from django_ratelimit.decorators import ratelimit
-from django.db.models.functions import TruncMonth
 from django.core.paginator import Paginator
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.utils import timezone
+from django.utils.html import escape
 from django.core.cache import cache
 from django.conf import settings
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import csv
 import stripe
 import json
 import logging
 from .services.recommender import get_recommendations
-
-# PostgreSQL full-text search (optional, with SQLite fallback)
-try:
-    from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-    HAS_POSTGRES_SEARCH = True
-except ImportError:
-    HAS_POSTGRES_SEARCH = False
-
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Table, Paragraph
-from reportlab.lib import colors
-import csv
 import logging
-from .models import Book, Department, Transaction, BookRequest, Profile, NewsItem, Eresource, BookReservation, InterLibraryLoanRequest
+from .models import Book, Department, Transaction, BookRequest, Profile, NewsItem, Eresource, BookReservation, InterLibraryLoanRequest, ReportJob
 from .forms import BookForm, IssueForm, ReturnForm, BookRequestForm, ProfileForm
-from .utils import calculate_fine
+from .utils import parse_date_range
 from .services.recommender import get_recommendations
+from .services.popularity import most_issued as most_issued_books
+from .services import circulation
+from .services.circulation import CirculationError
+from .services.exports import (
+    EXPORT_CHUNK_SIZE, TRANSACTION_EXPORT_FIELDS, TRANSACTION_EXPORT_HEADER, streaming_csv_response,
+    transactions_for_export,
+)
+from .services.facets import FILTER_PARAMS, book_filters, facet_counts
+from .services.kpis import LOW_STOCK_THRESHOLD, library_kpis, student_kpis
+from .services.notifications import inbox, inbox_item, notify
+from .services.pagination import CursorPaginator, paginate_list
+from .services.reports import report_job_payload
+from .services.rollup import issues_per_department, issues_per_month
+from .services.search import SEARCHABLE_FIELDS, cached_search, get_search_backend, hydrate_books, paginate_ranking
+from .services.suggest import suggest_titles
+from .tasks import generate_transactions_report
 
 logger = logging.getLogger(__name__)
 
@@ -115,23 +116,12 @@ def signup_view(request: HttpRequest):
 def book_list(request: HttpRequest):
     query = request.GET.get('q', '')
     book_type = request.GET.get('type', 'all')
-    books = Book.objects.all().order_by('-created_at')
-
+    cursor = request.GET.get('cursor')
     if query:
-        if book_type == 'title':
-            books = books.filter(title__icontains=query)
-        elif book_type == 'author':
-            books = books.filter(author__icontains=query)
-        elif book_type == 'subject':
-            books = books.filter(subject__icontains=query)
-        else:
-            books = books.filter(
-                Q(title__icontains=query) | Q(author__icontains=query) | Q(subject__icontains=query)
-            )
-
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        field = book_type if book_type in SEARCHABLE_FIELDS else None
+        page_obj = paginate_ranking(cached_search(query, field=field), cursor)
+    else:
+        page_obj = CursorPaginator(Book.objects.all(), 12, count='approximate').get_page(cursor)
 
     departments = Department.objects.all()
     authors = Book.objects.values_list('author', flat=True).distinct()
@@ -208,7 +198,7 @@ def student_dashboard(request: HttpRequest):
     issued_books = Transaction.objects.filter(user=request.user, returned_on__isnull=True).select_related('book')
 
     # Fine summary
-    fine_summary = Transaction.objects.filter(user=request.user, fine_amount__gt=0).aggregate(total=Sum('fine_amount'))['total'] or 0
+    fine_summary = student_kpis(request.user)['total_fines']
 
     # Borrowing history
     history = Transaction.objects.filter(user=request.user).select_related('book').order_by('-issued_on')
@@ -235,15 +225,12 @@ def librarian_dashboard(request: HttpRequest):
         return redirect('home')
 
     # Low stock books
-    low_stock = Book.objects.filter(available_copies__lte=2).select_related('department')
+    low_stock = Book.objects.filter(available_copies__lte=LOW_STOCK_THRESHOLD).select_related('department')
 
     # Frequent overdue students
     frequent_overdues = Transaction.objects.filter(fine_amount__gt=0).values('user__username').annotate(overdue_count=Count('id')).order_by('-overdue_count')[:10]
 
-    total_books = cache.get('total_books_count')
-    if total_books is None:
-        total_books = Book.objects.count()
-        cache.set('total_books_count', total_books, 3600)  # Cache for 1 hour
+    kpis = library_kpis()
 
     # Department inventory pressure (cached)
     dept_inventory = cache.get('dept_inventory_stats')
@@ -258,7 +245,10 @@ def librarian_dashboard(request: HttpRequest):
         'low_stock': low_stock,
         'frequent_overdues': frequent_overdues,
         'dept_inventory': dept_inventory,
-        'total_books': total_books,
+        'total_books': kpis['total_books'],
+        # Kept current by deltas pushed over the notification socket
+        'pending_requests': kpis['pending_requests'],
+        'overdue_count': kpis['overdue_count'],
     }
     return render(request, 'portal/librarian_dashboard.html', context)
 
@@ -269,43 +259,33 @@ def admin_dashboard(request: HttpRequest):
         return redirect('home')
 
     # System KPIs
-    total_books = Book.objects.count()
-    total_copies = Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0
-    available_books = Book.objects.filter(available_copies__gt=0).count()
-    active_students = Profile.objects.filter(role='student', is_active_member=True).count()
-    total_issues = Transaction.objects.count()
-    active_issues = Transaction.objects.filter(returned_on__isnull=True).count()
-    requested_books = BookRequest.objects.count()
-    pending_requests_count = BookRequest.objects.filter(status='PENDING').count()
-    overdue_count = Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).count()
-    total_fine_collected = Transaction.objects.filter(returned_on__isnull=False, fine_amount__gt=0).aggregate(total=Sum('fine_amount'))['total'] or 0
-    pending_fines = Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).aggregate(total=Sum('fine_amount'))['total'] or 0
+    kpis = library_kpis()
 
     # Overdue books
     overdue_books = Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).select_related('book', 'user')[:20]
 
     # Department-wise issues
-    dept_issues = Transaction.objects.values('book__department__name').annotate(issue_count=Count('id')).order_by('-issue_count')
+    dept_issues = [{'book__department__name': name, 'issue_count': issues} for name, issues in issues_per_department()]
 
     # Most issued books
-    most_issued = Transaction.objects.values('book__title').annotate(total_issues=Count('id')).order_by('-total_issues')[:10]
+    most_issued = most_issued_books(limit=10)
     recent_requests = BookRequest.objects.select_related('book', 'user').order_by('-created_at')[:10]
 
     # Monthly trends
-    monthly_trends = Transaction.objects.annotate(month=TruncMonth('issued_on')).values('month').annotate(count=Count('id')).order_by('month')
+    monthly_trends = [{'month': month, 'count': count} for month, count in issues_per_month()]
 
     context = {
-        'total_books': total_books,
-        'total_copies': total_copies,
-        'available_books': available_books,
-        'active_students': active_students,
-        'total_issues': total_issues,
-        'active_issues': active_issues,
-        'requested_books': requested_books,
-        'pending_requests_count': pending_requests_count,
-        'overdue_count': overdue_count,
-        'total_fine_collected': total_fine_collected,
-        'pending_fines': pending_fines,
+        'total_books': kpis['total_books'],
+        'total_copies': kpis['total_copies'],
+        'available_books': kpis['available_books'],
+        'active_students': kpis['active_students'],
+        'total_issues': kpis['total_issues'],
+        'active_issues': kpis['active_issues'],
+        'requested_books': kpis['requested_books'],
+        'pending_requests_count': kpis['pending_requests'],
+        'overdue_count': kpis['overdue_count'],
+        'total_fine_collected': kpis['total_fine_collected'],
+        'pending_fines': kpis['pending_fines'],
         'overdue_books': overdue_books,
         'dept_issues': dept_issues,
         'most_issued': most_issued,
@@ -323,39 +303,42 @@ def dashboard_stats(request: HttpRequest):
 
     if request.user.is_superuser:
         # Admin stats — keys match TC004 expected_keys: total_books, issued_books, overdue_books, students
+        kpis = library_kpis()
         data = {
-            'total_books': Book.objects.count(),
-            'total_copies': Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0,
-            'students': Profile.objects.filter(role='student', is_active_member=True).count(),
-            'active_students': Profile.objects.filter(role='student', is_active_member=True).count(),
-            'total_issues': Transaction.objects.count(),
-            'issued_books': Transaction.objects.filter(returned_on__isnull=True).count(),
-            'overdue_books': Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).count(),
-            'overdue_count': Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).count(),
-            'total_fine_collected': Transaction.objects.filter(returned_on__isnull=False, fine_amount__gt=0).aggregate(total=Sum('fine_amount'))['total'] or 0,
-            'pending_fines': Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).aggregate(total=Sum('fine_amount'))['total'] or 0,
+            'total_books': kpis['total_books'],
+            'total_copies': kpis['total_copies'],
+            'students': kpis['active_students'],
+            'active_students': kpis['active_students'],
+            'total_issues': kpis['total_issues'],
+            'issued_books': kpis['active_issues'],
+            'overdue_books': kpis['overdue_count'],
+            'overdue_count': kpis['overdue_count'],
+            'total_fine_collected': kpis['total_fine_collected'],
+            'pending_fines': kpis['pending_fines'],
         }
     elif request.user.is_staff:
         # Librarian stats
+        kpis = library_kpis()
         data = {
-            'low_stock_count': Book.objects.filter(available_copies__lte=2).count(),
-            'overdue_books': Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).count(),
-            'overdue_count': Transaction.objects.filter(returned_on__isnull=True, due_date__lt=timezone.now().date()).count(),
-            'pending_requests': BookRequest.objects.filter(status='PENDING').count(),
-            'total_books': Book.objects.count(),
-            'issued_books': Transaction.objects.filter(returned_on__isnull=True).count(),
-            'students': Profile.objects.filter(role='student').count(),
+            'low_stock_count': kpis['low_stock_count'],
+            'overdue_books': kpis['overdue_count'],
+            'overdue_count': kpis['overdue_count'],
+            'pending_requests': kpis['pending_requests'],
+            'total_books': kpis['total_books'],
+            'issued_books': kpis['active_issues'],
+            'students': kpis['students'],
         }
     else:
         # Student stats
+        kpis = student_kpis(request.user)
         data = {
-            'active_loans': Transaction.objects.filter(user=request.user, returned_on__isnull=True).count(),
-            'issued_books': Transaction.objects.filter(user=request.user, returned_on__isnull=True).count(),
-            'total_books': Transaction.objects.filter(user=request.user).count(),
-            'overdue_books': Transaction.objects.filter(user=request.user, returned_on__isnull=True, due_date__lt=timezone.now().date()).count(),
+            'active_loans': kpis['active_issues'],
+            'issued_books': kpis['active_issues'],
+            'total_books': kpis['total_issues'],
+            'overdue_books': kpis['overdue_count'],
             'students': 1,
-            'total_fines': Transaction.objects.filter(user=request.user, fine_amount__gt=0).aggregate(total=Sum('fine_amount'))['total'] or 0,
-            'total_borrowed': Transaction.objects.filter(user=request.user).count(),
+            'total_fines': kpis['total_fines'],
+            'total_borrowed': kpis['total_issues'],
         }
     return JsonResponse(data)
 
@@ -364,24 +347,26 @@ def dashboard_stats(request: HttpRequest):
 def department_issues_api(request: HttpRequest):
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
-    data = Transaction.objects.values('book__department__name').annotate(issue_count=Count('id')).order_by('-issue_count')
-    return JsonResponse(list(data), safe=False)
+    data = [
+        {'book__department__name': name, 'issue_count': issues}
+        for name, issues in issues_per_department(*parse_date_range(request.GET))
+    ]
+    return JsonResponse(data, safe=False)
 
 
 @login_required
 def monthly_trends_api(request: HttpRequest):
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
-    data = Transaction.objects.annotate(month=TruncMonth('issued_on')).values('month').annotate(count=Count('id')).order_by('month')
-    return JsonResponse(list(data), safe=False)
+    data = [{'month': month, 'count': count} for month, count in issues_per_month(*parse_date_range(request.GET))]
+    return JsonResponse(data, safe=False)
 
 
 @login_required
 def most_issued_books_api(request: HttpRequest):
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
-    data = Transaction.objects.values('book__title').annotate(total_issues=Count('id')).order_by('-total_issues')[:10]
-    return JsonResponse(list(data), safe=False)
+    return JsonResponse(most_issued_books(limit=10), safe=False)
 
 
 @login_required
@@ -398,12 +383,97 @@ def overdue_books_api(request: HttpRequest):
 def low_stock_books_api(request: HttpRequest):
     if not request.user.is_staff:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
-    data = Book.objects.filter(available_copies__lte=2).select_related('department').values(
+    data = Book.objects.filter(available_copies__lte=LOW_STOCK_THRESHOLD).select_related('department').values(
         'title', 'available_copies', 'total_copies', 'department__name'
     )
     return JsonResponse(list(data), safe=False)
 
 
+def books_api(request: HttpRequest):
+    """Catalog listing, newest first, paged by ``cursor``; ``count=exact|approximate`` adds a total."""
+    books = Book.objects.select_related('department')
+    if request.GET.get('department'):
+        books = books.filter(department_id=request.GET['department'])
+    try:
+        per_page = min(max(int(request.GET.get('per_page', 20)), 1), 100)
+    except ValueError:
+        per_page = 20
+    count = request.GET.get('count') if request.GET.get('count') in ('exact', 'approximate') else None
+    page = CursorPaginator(books, per_page, count=count).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [{
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'department': book.department.name if book.department else None,
+            'available_copies': book.available_copies,
+            'total_copies': book.total_copies,
+        } for book in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'count': page.count,
+        'count_is_approximate': page.count_is_approximate,
+    })
+
+
+@login_required
+def notification_inbox_api(request: HttpRequest):
+    """The user's notifications, newest first, paged by ``cursor``; ``after=<seq>`` limits them to newer ones."""
+    notifications = inbox(request.user.pk)
+    after = request.GET.get('after', '')
+    if after.isdigit():
+        notifications = notifications.filter(seq__gt=int(after))
+    try:
+        per_page = min(max(int(request.GET.get('per_page', 20)), 1), 100)
+    except ValueError:
+        per_page = 20
+    page = CursorPaginator(notifications, per_page, ordering=('-seq',)).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [inbox_item(notification) for notification in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+@login_required
+def circulation_batch_api(request: HttpRequest):
+    """
+    Issue or return a scanned cart in one round trip.
+
+    POST ``{"action": "issue"|"return", "items": [{"username"|"user_id", "book_id"|"isbn"}, ...]}``;
+    the response lists each item's outcome in order.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method.'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+    action, items = data.get('action'), data.get('items')
+    if action not in ('issue', 'return'):
+        return JsonResponse({'error': 'action must be "issue" or "return".'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'items must be a non-empty list.'}, status=400)
+    if len(items) > circulation.BATCH_MAX_ITEMS:
+        return JsonResponse({'error': f'At most {circulation.BATCH_MAX_ITEMS} items per batch.'}, status=400)
+
+    if action == 'issue':
+        results = circulation.issue_batch(items)
+    else:
+        results = circulation.return_batch(items)
+    succeeded = sum(result['ok'] for result in results)
+    return JsonResponse({
+        'action': action,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results,
+    })
+
+
 @login_required
 def student_issued_api(request: HttpRequest):
     data = Transaction.objects.filter(user=request.user, returned_on__isnull=True).select_related('book').values(
@@ -446,14 +516,14 @@ def issue_book(request: HttpRequest):
     if request.method == 'POST':
         form = IssueForm(request.POST)
         if form.is_valid():
-            transaction = form.save(commit=False)
-            transaction.user = request.user
-            transaction.save()
-            book = transaction.book
-            book.available_copies -= 1
-            book.save()
-            messages.success(request, f'Book "{book.title}" issued successfully!')
-            return redirect('my_books')
+            book = form.cleaned_data['book']
+            try:
+                circulation.issue_loan(request.user, book)
+            except CirculationError as exc:
+                messages.error(request, str(exc))
+            else:
+                messages.success(request, f'Book "{book.title}" issued successfully!')
+                return redirect('my_books')
     else:
         form = IssueForm()
     return render(request, 'portal/issue_book.html', {'form': form})
@@ -464,11 +534,11 @@ def return_book(request: HttpRequest, tx_id):
     transaction = get_object_or_404(Transaction, pk=tx_id, user=request.user)
     if request.method == 'POST':
         returned_date = timezone.localdate()
-        transaction.returned_on = returned_date
-        transaction.fine_amount = calculate_fine(transaction.due_date, returned_date)
-        transaction.save()
-        transaction.book.available_copies += 1
-        transaction.book.save()
+        try:
+            transaction, reservation = circulation.return_loan(transaction, returned_date)
+        except CirculationError as exc:
+            messages.error(request, str(exc))
+            return redirect('my_books')
         
         # Gamification: Update user's points and reading streak
         try:
@@ -492,29 +562,10 @@ def return_book(request: HttpRequest, tx_id):
         except Exception:
             pass
         
-        # Check if there is an active reservation for this book
-        reservation = BookReservation.objects.filter(book=transaction.book, status='WAITING').order_by('created_at').first()
+        # The copy went on hold if someone had reserved this book
         if reservation:
-            reservation.status = 'AVAILABLE'
-            reservation.available_at = timezone.now()
-            reservation.expires_at = timezone.now() + timezone.timedelta(hours=48)
-            reservation.save()
-            transaction.book.available_copies -= 1
-            transaction.book.save()
-            # Send an email notification (Async) or just signal here:
+            # The student's notification was queued to the outbox with the hold
             messages.success(request, f'Book "{transaction.book.title}" returned! It has been set aside for a reserved student.')
-            
-            # WebSocket Notification
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{reservation.user.username}",
-                {
-                    "type": "notification.message",
-                    "title": "Reservation Available!",
-                    "message": f"Your reserved book '{transaction.book.title}' is now available. You have 48 hours to collect it.",
-                    "type_status": "success"
-                }
-            )
         else:
             messages.success(request, f'Book "{transaction.book.title}" returned successfully!')
         return redirect('my_books')
@@ -524,132 +575,84 @@ def return_book(request: HttpRequest, tx_id):
 
 
 
+@login_required
 def export_transactions_csv(request: HttpRequest):
-    start_date = request.GET.get('start')
-    end_date = request.GET.get('end')
-    transactions = Transaction.objects.select_related('user', 'book').all()
-    if start_date:
-        transactions = transactions.filter(issued_on__gte=start_date)
-    if end_date:
-        transactions = transactions.filter(issued_on__lte=end_date)
+    if not request.user.is_staff:
+        return redirect('home')
+    start_date, end_date = parse_date_range(request.GET)
+    rows = transactions_for_export(start_date, end_date, request.GET.get('department', '')).values_list(
+        *TRANSACTION_EXPORT_FIELDS
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
     filename = f"transactions_{start_date or 'all'}_{end_date or 'all'}.csv"
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    writer = csv.writer(response)
-    writer.writerow(['User', 'Book', 'Issue Date', 'Due Date', 'Returned On', 'Fine'])
-    for tx in transactions:
-        writer.writerow([
-            tx.user.username,
-            tx.book.title,
-            tx.issued_on,
-            tx.due_date,
-            tx.returned_on or 'Not Returned',
-            tx.fine_amount or 0,
-        ])
-    return response
+    return streaming_csv_response(
+        filename,
+        TRANSACTION_EXPORT_HEADER,
+        rows,
+        formatter=lambda row: (*row[:4], row[4] or 'Not Returned', row[5] or 0),
+    )
 
 
+@login_required
 def export_transactions_pdf(request: HttpRequest):
-    start_date = request.GET.get('start')
-    end_date = request.GET.get('end')
-    transactions = Transaction.objects.select_related('user', 'book').all()
-    if start_date:
-        transactions = transactions.filter(issued_on__gte=start_date)
-    if end_date:
-        transactions = transactions.filter(issued_on__lte=end_date)
-    filename = f"transactions_{start_date or 'all'}_{end_date or 'all'}.pdf"
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    story = []
-    styles = getSampleStyleSheet()
-    story.append(Paragraph("Library Transactions Report", styles['Title']))
-    data = [['User', 'Book', 'Issue Date', 'Due Date', 'Returned On', 'Fine']]
-    for tx in transactions:
-        data.append([
-            tx.user.username,
-            tx.book.title,
-            str(tx.issued_on),
-            str(tx.due_date),
-            str(tx.returned_on or 'Not Returned'),
-            str(tx.fine_amount or 0),
-        ])
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    story.append(table)
-    doc.build(story)
-    return response
+    """Queue the transactions PDF; the worker notifies the user over the notification socket when it is ready."""
+    if not request.user.is_staff:
+        return redirect('home')
+    start_date, end_date = parse_date_range(request.GET)
+    job = ReportJob.objects.create(
+        user=request.user,
+        kind='transactions_pdf',
+        params={
+            'start': start_date.isoformat() if start_date else None,
+            'end': end_date.isoformat() if end_date else None,
+            'department': request.GET.get('department', ''),
+        },
+    )
+    try:
+        generate_transactions_report.delay(job.id)
+    except Exception as exc:
+        logger.exception("Could not queue report job %s", job.id)
+        ReportJob.objects.filter(id=job.id).update(status='FAILED', error=str(exc), finished_at=timezone.now())
+        job.refresh_from_db()
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse(report_job_payload(job), status=202 if job.status != 'FAILED' else 503)
+    if job.status == 'FAILED':
+        messages.error(request, "The PDF report could not be queued. Please try again later.")
+    else:
+        messages.info(request, "Your PDF report is being generated. You'll be notified when it is ready to download.")
+    return redirect('admin_dashboard' if request.user.is_superuser else 'librarian_dashboard')
+
+
+@login_required
+def report_status(request: HttpRequest, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    return JsonResponse(report_job_payload(job))
+
 
+@login_required
+def report_download(request: HttpRequest, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    if job.status != 'READY' or not job.file:
+        return JsonResponse(report_job_payload(job), status=409)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
 
-@ratelimit(key='ip', rate='10/m', method='GET')
+
+@ratelimit(key='ip', rate='120/m', method='GET')
 def search_suggestions(request: HttpRequest):
     query = request.GET.get('q', '')
-    if not query:
+    if not query.strip():
         return JsonResponse([], safe=False)
-    results = []
-    if HAS_POSTGRES_SEARCH:
-        try:
-            # PostgreSQL full-text search for suggestions
-            vector = SearchVector('title', weight='A') + SearchVector('author', weight='B')
-            search_query = SearchQuery(query, search_type='plain')
-            suggestions = (
-                Book.objects
-                .annotate(rank=SearchRank(vector, search_query))
-                .filter(rank__gte=0.01)
-                .order_by('-rank')[:5]
-                .values_list('title', flat=True)
-            )
-            results = list(suggestions)
-        except Exception:
-            results = []
-    # Fallback to icontains if FTS returns nothing or not available
-    if not results:
-        results = list(
-            Book.objects.filter(
-                Q(title__istartswith=query) | Q(author__istartswith=query)
-            )[:5].values_list('title', flat=True)
-        )
-    return JsonResponse(results, safe=False)
+    return JsonResponse(suggest_titles(query, limit=5), safe=False)
 
 
 def search_view(request: HttpRequest):
     query = request.GET.get('q', '')
+    cursor = request.GET.get('cursor')
     if query:
-        books = None
-        if HAS_POSTGRES_SEARCH:
-            try:
-                # PostgreSQL full-text search with ranking
-                vector = SearchVector('title', weight='A') + SearchVector('author', weight='B') + SearchVector('subject', weight='C')
-                search_query = SearchQuery(query, search_type='plain')
-                books = (
-                    Book.objects
-                    .annotate(search=vector, rank=SearchRank(vector, search_query))
-                    .filter(rank__gte=0.01)
-                    .order_by('-rank', '-created_at')
-                )
-                if not books.exists():
-                    books = None
-            except Exception:
-                books = None
-        # Fallback if FTS yields no results or not available
-        if books is None:
-            books = Book.objects.filter(
-                Q(title__icontains=query) | Q(author__icontains=query) | Q(subject__icontains=query)
-            ).order_by('-created_at')
+        # Ranked once by the configured backend (PostgreSQL full-text or the in-memory
+        # BM25 index); every page is sliced from the cached ranking.
+        page_obj = paginate_ranking(cached_search(query), cursor)
     else:
-        books = Book.objects.all().order_by('-created_at')
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        page_obj = CursorPaginator(Book.objects.all(), 12, count='approximate').get_page(cursor)
     context = {'page_obj': page_obj, 'results': page_obj.object_list, 'query': query}
     return render(request, 'portal/search_results.html', context)
 
@@ -666,25 +669,8 @@ def advanced_search_view(request: HttpRequest):
         book_type = request.GET.get('book_type', '')
         sort_by = request.GET.get('sort_by', '-created_at')
 
-        books = Book.objects.all()
-        if title:
-            books = books.filter(title__icontains=title)
-        if author:
-            books = books.filter(author__icontains=author)
-        if department_name:
-            books = books.filter(department__name__iexact=department_name)
-        if category_name:
-            books = books.filter(subject__iexact=category_name)
-        if availability == 'available':
-            books = books.filter(available_copies__gt=0)
-        elif availability == 'issued':
-            books = books.filter(available_copies=0)
-        if publication_year:
-            books = books.filter(publication_year=publication_year)
-        if language:
-            books = books.filter(language__iexact=language)
-        if book_type:
-            books = books.filter(book_type__iexact=book_type)
+        params = {name: request.GET.get(name, '') for name in FILTER_PARAMS}
+        books = Book.objects.filter(book_filters(params))
 
         if sort_by in ['title', '-title', 'publication_year', '-publication_year', 'created_at', '-created_at']:
             books = books.order_by(sort_by)
@@ -695,12 +681,8 @@ def advanced_search_view(request: HttpRequest):
         page_number = request.GET.get('page')
         page_obj = paginator.get_page(page_number)
         
-        departments = Department.objects.all()
-        authors = Book.objects.exclude(author='').values_list('author', flat=True).distinct()
-        categories = Book.objects.exclude(subject='').values_list('subject', flat=True).distinct()
-        languages = Book.objects.exclude(language='').values_list('language', flat=True).distinct().order_by('language')
-        book_types = Book.objects.exclude(book_type='').values_list('book_type', flat=True).distinct().order_by('book_type')
-        publication_years = Book.objects.exclude(publication_year__isnull=True).values_list('publication_year', flat=True).distinct().order_by('-publication_year')
+        # Dropdown options with hit counts, from one grouped query
+        facets = facet_counts(params)
 
         context = {
             "title": title,
@@ -714,12 +696,11 @@ def advanced_search_view(request: HttpRequest):
             "sort_by": sort_by,
             "results": books,
             "page_obj": page_obj,
-            "departments": departments,
-            "authors": authors,
-            "categories": categories,
-            "languages": languages,
-            "book_types": book_types,
-            "publication_years": publication_years,
+            "departments": facets['department'],
+            "categories": facets['category'],
+            "languages": facets['language'],
+            "book_types": facets['book_type'],
+            "publication_years": facets['publication_year'],
         }
 
         return render(request, "portal/advanced_search.html", context)
@@ -742,47 +723,31 @@ def manage_requests(request: HttpRequest):
         action = request.POST.get('action')
         book_request = get_object_or_404(BookRequest, pk=request_id)
         if action == 'approve':
-            # Create transaction
-            Transaction.objects.create(
-                user=book_request.user,
-                book=book_request.book,
-                due_date=timezone.localdate() + timezone.timedelta(days=14)
-            )
-            # Decrease available copies
-            book_request.book.available_copies -= 1
-            book_request.book.save()
-            book_request.status = 'APPROVED'
-            book_request.processed_at = timezone.now()
+            # Take a copy, open the loan and mark the request approved in one transaction
+            try:
+                # The student's notification goes to the outbox in the approval's transaction
+                with db_transaction.atomic():
+                    book_request, _ = circulation.approve_request(book_request)
+                    notify(
+                        book_request.user, "Request Approved",
+                        f"Your request for '{escape(book_request.book.title)}' was approved. Please collect it from the librarian.",
+                        'success',
+                    )
+            except CirculationError as exc:
+                messages.error(request, str(exc))
+                return redirect('manage_requests')
             messages.success(request, f'Request approved for {book_request.book.title}')
-            
-            # WebSocket Notification
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{book_request.user.username}",
-                {
-                    "type": "notification.message",
-                    "title": "Request Approved",
-                    "message": f"Your request for '{book_request.book.title}' was approved. Please collect it from the librarian.",
-                    "type_status": "success"
-                }
-            )
         elif action == 'reject':
-            book_request.status = 'REJECTED'
-            book_request.processed_at = timezone.now()
+            with db_transaction.atomic():
+                book_request.status = 'REJECTED'
+                book_request.processed_at = timezone.now()
+                book_request.save()
+                notify(
+                    book_request.user, "Request Rejected",
+                    f"Your request for '{escape(book_request.book.title)}' was rejected.",
+                    'error',
+                )
             messages.success(request, f'Request rejected for {book_request.book.title}')
-            
-            # WebSocket Notification
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{book_request.user.username}",
-                {
-                    "type": "notification.message",
-                    "title": "Request Rejected",
-                    "message": f"Your request for '{book_request.book.title}' was rejected.",
-                    "type_status": "error"
-                }
-            )
-        book_request.save()
         return redirect('manage_requests')
 
     context = {
@@ -948,11 +913,8 @@ def department_books(request: HttpRequest, dept_id):
     Display books for a specific department.
     """
     department = get_object_or_404(Department, pk=dept_id)
-    books = Book.objects.filter(department=department).order_by('-created_at')
-
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    books = Book.objects.filter(department=department)
+    page_obj = CursorPaginator(books, 12, count='approximate').get_page(request.GET.get('cursor'))
 
     context = {
         'page_obj': page_obj,
@@ -991,11 +953,7 @@ def advanced_search(request: HttpRequest):
     elif availability == 'issued':
         books = books.filter(available_copies=0)
 
-    books = books.order_by('-created_at')
-
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = CursorPaginator(books, 12, count='approximate').get_page(request.GET.get('cursor'))
 
     departments = Department.objects.all()
     authors = Book.objects.values_list('author', flat=True).distinct()
@@ -1021,10 +979,8 @@ def trending_books(request: HttpRequest):
     """
     Display trending books page.
     """
-    books = Book.objects.filter(is_trending=True).order_by('-created_at')
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    books = Book.objects.filter(is_trending=True)
+    page_obj = CursorPaginator(books, 12, count='approximate').get_page(request.GET.get('cursor'))
     context = {
         'page_obj': page_obj,
         'title': 'Trending Books',
@@ -1037,10 +993,8 @@ def new_arrivals(request: HttpRequest):
     """
     Display new arrivals page.
     """
-    books = Book.objects.order_by('-created_at')[:50]
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    books = list(Book.objects.order_by('-created_at')[:50])
+    page_obj = paginate_list(books, request.GET.get('cursor'))
     context = {
         'page_obj': page_obj,
         'title': 'New Arrivals',
@@ -1053,10 +1007,8 @@ def rare_books(request: HttpRequest):
     """
     Display rare books page.
     """
-    books = Book.objects.filter(subject__icontains='Rare').order_by('title')
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    books = Book.objects.filter(subject__icontains='Rare')
+    page_obj = CursorPaginator(books, 12, ordering=('title', 'id'), count='approximate').get_page(request.GET.get('cursor'))
     context = {
         'page_obj': page_obj,
         'title': 'Rare Books',
@@ -1069,10 +1021,8 @@ def theses_dissertations(request: HttpRequest):
     """
     Display theses and dissertations page.
     """
-    books = Book.objects.filter(subject__icontains='Thesis').order_by('title')
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    books = Book.objects.filter(subject__icontains='Thesis')
+    page_obj = CursorPaginator(books, 12, ordering=('title', 'id'), count='approximate').get_page(request.GET.get('cursor'))
     context = {
         'page_obj': page_obj,
         'title': 'Theses & Dissertations',
@@ -1085,10 +1035,8 @@ def anu_archives(request: HttpRequest):
     """
     Display ANU archives page.
     """
-    books = Book.objects.filter(subject__icontains='Archive').order_by('title')
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    books = Book.objects.filter(subject__icontains='Archive')
+    page_obj = CursorPaginator(books, 12, ordering=('title', 'id'), count='approximate').get_page(request.GET.get('cursor'))
     context = {
         'page_obj': page_obj,
         'title': 'ANU Archives',
@@ -1117,15 +1065,12 @@ def chatbot_api(request: HttpRequest):
             return JsonResponse({'reply': 'The AI Librarian is sleeping. (Please configure OPENAI_API_KEY in the .env file)'})
             
         # Basic RAG logic: find some books matching words in the user query to give context.
-        keywords = user_message.lower().split()
+        keywords = [kw for kw in user_message.lower().split() if len(kw) > 3]  # Ignore small words
         books_context = ""
-        matching_books = Book.objects.none()
-        for kw in keywords:
-            if len(kw) > 3: # Ignore small words
-                matching_books |= Book.objects.filter(Q(title__icontains=kw) | Q(author__icontains=kw) | Q(subject__icontains=kw))
-        
-        matching_books = matching_books.distinct()[:5]
-        if matching_books.exists():
+        matching_books = []
+        if keywords:
+            matching_books = hydrate_books(get_search_backend().search(' '.join(keywords), limit=5, match_any=True))
+        if matching_books:
             books_context = "Here are some books in our catalog that might be relevant to the query:\\n"
             for b in matching_books:
                 books_context += f"- '{b.title}' by {b.author} (Subject: {b.subject}, Copies Available: {b.available_copies}, Rack: {b.rack})\\n"
@@ -1184,24 +1129,8 @@ def reserve_book(request: HttpRequest, book_id):
 @login_required
 def cancel_reservation(request: HttpRequest, res_id):
     reservation = get_object_or_404(BookReservation, pk=res_id, user=request.user, status__in=['WAITING', 'AVAILABLE'])
-    
-    if reservation.status == 'AVAILABLE':
-        # Free up the held book copy for the next user or catalog
-        reservation.book.available_copies += 1
-        reservation.book.save()
-
-        # Check if another user is waiting for it
-        next_res = BookReservation.objects.filter(book=reservation.book, status='WAITING').exclude(id=reservation.id).order_by('created_at').first()
-        if next_res:
-            next_res.status = 'AVAILABLE'
-            next_res.available_at = timezone.now()
-            next_res.expires_at = timezone.now() + timezone.timedelta(hours=48)
-            next_res.save()
-            reservation.book.available_copies -= 1
-            reservation.book.save()
-
-    reservation.status = 'CANCELLED'
-    reservation.save()
+    # A held copy passes to the next student in the queue, or back to the shelf
+    circulation.cancel_reservation(reservation)
     messages.success(request, 'Reservation cancelled successfully.')
     return redirect('my_books')
 
@@ -80,3 +80,40 @@ class BookRequestModelTest(TestCase):
         self.assertEqual(req.user.username, 'testuser2')
         self.assertEqual(req.book.title, 'Science Basics')
         self.assertIn('Science Basics', str(req))
+
+class ApproveRequestViewTest(TestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_user(username='approver', password='password123', is_staff=True)
+        self.student = User.objects.create_user(username='requester', password='password123')
+        self.book = Book.objects.create(
+            title='Single Copy',
+            author='Scarce Author',
+            isbn='9990000000001',
+            department=BooksDepartment.objects.create(name='Rare'),
+            total_copies=1,
+            available_copies=1
+        )
+        self.first = BookRequest.objects.create(user=self.student, book=self.book)
+        self.second = BookRequest.objects.create(user=self.student, book=self.book)
+
+    def approve(self, book_request):
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        from django.test import RequestFactory
+        from .views import approve_request
+        request = RequestFactory().post(f'/approve-request/{book_request.pk}/')
+        request.user = self.librarian
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        approve_request(request, book_request.pk)
+        book_request.refresh_from_db()
+        return [str(message) for message in request._messages]
+
+    def test_approval_takes_the_copy_once(self):
+        self.approve(self.first)
+        self.assertEqual(self.first.status, 'approved')
+        self.assertEqual(self.approve(self.first), ['Request is not pending.'])
+        self.assertEqual(self.approve(self.second), ['Book is not available.'])
+        self.assertEqual(self.second.status, 'pending')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Transaction.objects.filter(book=self.book).count(), 1)
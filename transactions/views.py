@@ -1,10 +1,12 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction as db_transaction
 from django.utils import timezone
 from datetime import timedelta
 from .models import BookRequest, Transaction
 from books.models import Book
+from portal.services.circulation import CirculationError, take_copy
 
 @login_required
 def my_requests(request):
@@ -30,31 +32,28 @@ def approve_request(request, pk):
         messages.error(request, 'Only librarians can approve requests.')
         return redirect('manage_requests')
 
-    book_request = get_object_or_404(BookRequest, pk=pk)
-    if book_request.status != 'pending':
-        messages.error(request, 'Request is not pending.')
-        return redirect('manage_requests')
-
-    # Check if book is available
-    if book_request.book.available_copies <= 0:
+    due_date = timezone.now().date() + timedelta(days=14)
+    # Lock the request, take the copy and issue the loan together, so a double-submitted
+    # approval or concurrent checkouts cannot oversell
+    try:
+        with db_transaction.atomic():
+            book_request = get_object_or_404(BookRequest.objects.select_for_update(of=('self',)).select_related('book'), pk=pk)
+            if book_request.status != 'pending':
+                messages.error(request, 'Request is not pending.')
+                return redirect('manage_requests')
+            take_copy(book_request.book)
+            book_request.status = 'approved'
+            book_request.processed_at = timezone.now()
+            book_request.save()
+            Transaction.objects.create(
+                user=book_request.user,
+                book=book_request.book,
+                due_date=due_date
+            )
+    except CirculationError:
         messages.error(request, 'Book is not available.')
         return redirect('manage_requests')
 
-    # Approve request and issue book
-    book_request.status = 'approved'
-    book_request.processed_at = timezone.now()
-    book_request.save()
-
-    # Create transaction
-    due_date = timezone.now().date() + timedelta(days=14)
-    Transaction.objects.create(
-        user=book_request.user,
-        book=book_request.book,
-        due_date=due_date
-    )
-    book_request.book.available_copies -= 1
-    book_request.book.save()
-
     messages.success(request, f'Request approved and book issued. Due date: {due_date}')
     return redirect('manage_requests')
 